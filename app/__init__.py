@@ -3,9 +3,15 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from datetime import timedelta
+import os
+
+from app.database import (
+    RoutingSession, database_uri, env_setting, engine_options, init_read_routing, install_sqlite_pragmas,
+    read_database_uri, READ_BIND
+)
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
@@ -17,21 +23,95 @@ def create_app():
 
     # Configuration
     app.config['SECRET_KEY'] = 'kuhes-campus-connect-2024-secret-key-change-this-later'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///kuhes.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()  # $DATABASE_URL, default sqlite:///kuhes.db
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Each database setting below can be overridden by an environment variable of the same name
+    app.config['DATABASE_POOL_SIZE'] = env_setting('DATABASE_POOL_SIZE', 5, int)  # connections kept per process (not SQLite)
+    app.config['DATABASE_MAX_OVERFLOW'] = env_setting('DATABASE_MAX_OVERFLOW', 10, int)  # extra connections under load
+    app.config['DATABASE_POOL_TIMEOUT'] = env_setting('DATABASE_POOL_TIMEOUT', 30, int)  # seconds to wait for a connection
+    app.config['DATABASE_POOL_RECYCLE'] = env_setting('DATABASE_POOL_RECYCLE', 1800, int)  # seconds before a connection is replaced
+    app.config['SQLITE_JOURNAL_MODE'] = env_setting('SQLITE_JOURNAL_MODE', 'WAL')  # readers don't block the writer
+    app.config['SQLITE_SYNCHRONOUS'] = env_setting('SQLITE_SYNCHRONOUS', 'NORMAL')  # safe with WAL, no fsync per commit
+    app.config['SQLITE_BUSY_TIMEOUT'] = env_setting('SQLITE_BUSY_TIMEOUT', 15.0, float)  # seconds a writer waits for the lock
+    app.config['SQLITE_CACHE_SIZE_KB'] = env_setting('SQLITE_CACHE_SIZE_KB', 32768, int)  # page cache per connection
+    app.config['SQLITE_MMAP_SIZE'] = env_setting('SQLITE_MMAP_SIZE', 256 * 1024 * 1024, int)  # bytes read through mmap
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    # Reads of GET/HEAD requests go to a replica ($DATABASE_READ_URL) or a read-only SQLite pool
+    app.config['DATABASE_READ_URI'] = read_database_uri(app.config['SQLALCHEMY_DATABASE_URI'])  # None = no routing
+    app.config['DATABASE_READ_YOUR_WRITES'] = env_setting('DATABASE_READ_YOUR_WRITES', 5, float)  # seconds reads stay on the primary after a write
+    if app.config['DATABASE_READ_URI']:
+        app.config['SQLALCHEMY_BINDS'] = {
+            READ_BIND: {'url': app.config['DATABASE_READ_URI'], **engine_options(
+                dict(app.config, SQLALCHEMY_DATABASE_URI=app.config['DATABASE_READ_URI']))}
+        }
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
     app.config['SESSION_PERMANENT'] = True
+    app.config['SESSION_BACKEND'] = 'database'  # server-side session store: 'database' or 'filesystem'
+    app.config['SESSION_FILE_DIR'] = os.path.join(app.instance_path, 'sessions')  # for 'filesystem'
+    app.config['SESSION_CACHE_SIZE'] = 1024  # sessions kept in each process's LRU
+    app.config['SESSION_CACHE_TTL'] = 30  # seconds a cached session is trusted without re-reading it
+    app.config['STATS_CACHE_TTL'] = 60  # seconds the home page sidebar figures are reused
+    app.config['REACTIONS_BATCH_LIMIT'] = 50  # most posts /posts/reactions answers at once
+    app.config['MODERATION_BATCH_LIMIT'] = 500  # most events one /events/moderate request may handle
+    app.config['CALENDAR_MAX_WINDOW'] = timedelta(days=62)  # widest range /events/calendar/feed serves
+    app.config['ICAL_CACHE_DIR'] = os.path.join(app.instance_path, 'ical')  # generated .ics feeds
+    app.config['ICAL_MAX_AGE'] = 300  # seconds calendar apps and proxies may reuse a feed
+    app.config['USER_CACHE_TTL'] = 60  # seconds a logged-in user is reused before reloading (0 = off)
+    app.config['USER_CACHE_SIZE'] = 1024  # users kept per process
+    app.config['USER_CACHE_RECHECK'] = 5  # seconds a cached user's role and session version are trusted (0 = every request)
+    app.config['STATS_LOG_INTERVAL'] = 300  # seconds between per-process cache and hashing stats log lines (0 = off)
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:600000'  # older hashes are upgraded at login
+    app.config['PASSWORD_HASH_WORKERS'] = 2  # hashing processes per worker (0 = hash inline)
+    app.config['PASSWORD_HASH_MAX_PENDING'] = 16  # hashes queued or running before callers wait
+    app.config['PASSWORD_HASH_WAIT_TIMEOUT'] = 5  # seconds to wait for a slot before giving up
+    app.config['NOTIFICATION_COALESCE_WINDOW'] = timedelta(hours=24)  # None = one row per reaction
+    app.config['NOTIFICATION_STREAM_KEEPALIVE'] = 20  # seconds between SSE keepalive comments
+    app.config['NOTIFICATION_STREAM_POLL'] = 3  # seconds between checks for other processes' changes (one query per process)
+    app.config['NOTIFICATION_STREAM_RESYNC'] = 300  # seconds between full re-sends (a safety net)
+    app.config['NOTIFICATION_STREAM_LIFETIME'] = 600  # seconds before a stream closes and the browser reconnects
+    app.config['NOTIFICATION_STREAM_MAX'] = env_setting('NOTIFICATION_STREAM_MAX', 800, int)  # open streams per process; keep below gunicorn --worker-connections
+    # flask prune-notifications policies (None turns a policy off)
+    app.config['NOTIFICATION_RETENTION_READ_DAYS'] = 90  # delete read notifications older than this
+    app.config['NOTIFICATION_RETENTION_MAX_PER_USER'] = 500  # keep each user's newest N notifications
+    app.config['NOTIFICATION_OUTBOX_RETENTION_DAYS'] = 7  # delete delivered outbox entries older than this
+    app.config['NOTIFICATION_RETENTION_BATCH'] = 500  # rows deleted per transaction
 
     # Initialize extensions with app
     db.init_app(app)
+    with app.app_context():
+        install_sqlite_pragmas(db.engine, app.config)
+    init_read_routing(app, db)
     login_manager.init_app(app)
 
+    # Session data lives server-side; the cookie only carries its id
+    from app.sessions import create_session_interface
+    app.session_interface = create_session_interface(app)
+
     # User loader for Flask-Login
-    from app.models import User
+    from app.models import User, Post, Notification
+
+    from app.passwords import hasher
+    hasher.configure(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_WORKERS'],
+                     app.config['PASSWORD_HASH_MAX_PENDING'], app.config['PASSWORD_HASH_WAIT_TIMEOUT'])
+    app.extensions['password_hasher'] = hasher
+
+    from app.user_cache import user_cache
+    user_cache.configure(app.config['USER_CACHE_TTL'], app.config['USER_CACHE_SIZE'],
+                         app.config['USER_CACHE_RECHECK'])
+    app.extensions['user_cache'] = user_cache
+
+    from app.stats import init_stats_log
+    init_stats_log(app, {'user_cache': user_cache.stats, 'password_hasher': hasher.stats})
 
     @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
+    def load_user(login_id):
+        # "<id>:<session_version>"; ids from before versioning count as version 0
+        user_id, _, version = login_id.partition(':')
+        # Served from the per-process cache; a miss loads the user as before
+        user = user_cache.load(int(user_id), db.session)
+        if user is None or int(version or 0) != (user.session_version or 0):
+            return None
+        return user
 
     # Import and register blueprints
     # The routes are automatically imported via the blueprint __init__.py files
@@ -45,9 +125,33 @@ def create_app():
     app.register_blueprint(events_bp, url_prefix='/events')
     app.register_blueprint(forum_bp, url_prefix='/forum')
 
-    # Create database tables
+    # Maintenance commands (flask --app run <command>)
+    from app.commands import register_commands
+    register_commands(app)
+
+    # Create database tables, then add any columns/indexes older databases lack
+    from app.schema import upgrade_schema
+    from app.search import ensure_search_index
+    from app.conflicts import rebuild_bookings
+    from app.lifecycle import rebuild_phases
+
     with app.app_context():
+        had_actor_table = db.inspect(db.engine).has_table('notification_actors')
         db.create_all()
+        added_columns = upgrade_schema()
+
+        # Counters added to an existing database start at 0 - fill them in
+        if 'posts.comment_count' in added_columns:
+            Post.rebuild_counters()
+        if 'users.unread_notification_count' in added_columns:
+            User.rebuild_unread_counts()
+        if not had_actor_table:
+            Notification.rebuild_actors()
+        if 'events.venue_key' in added_columns:
+            rebuild_bookings()
+        if 'events.phase' in added_columns:
+            rebuild_phases()
+        app.config['SEARCH_FTS_ENABLED'] = ensure_search_index()
 
     return app
 
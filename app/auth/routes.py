@@ -3,6 +3,8 @@
 from flask import render_template, flash, redirect, url_for, request, session
 from flask_login import login_user, logout_user, current_user, login_required
 from app.models import User
+from app.cache import invalidate, HOME_STATS
+from app.passwords import HashingBusy
 from app import db
 
 # Import auth_bp from the auth package
@@ -23,16 +25,19 @@ def login():
 
         user = User.query.filter_by(username=username).first()
 
-        if user and user.check_password(password):
+        try:
+            authenticated = user is not None and user.check_password(password)
+            # Upgrade hashes made with an older algorithm or cost while we have the password
+            if authenticated and user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
+        except HashingBusy:
+            flash('We are handling a lot of sign-ins right now. Please try again in a moment.', 'warning')
+            return render_template('auth/login.html', title='Sign In'), 503
+
+        if authenticated:
             login_user(user, remember=True)
 
-            # Store user info in session (for backward compatibility)
-            session['user_id'] = user.id
-            session['username'] = user.username
-            session['full_name'] = user.get_full_name()
-            session['email'] = user.email
-            session['role'] = user.role
-
             flash('Login successful! Welcome back.', 'success')
             return redirect(url_for('main.home'))
         else:
@@ -86,21 +91,19 @@ def register():
                 program=program,
                 year=year
             )
-            user.set_password(password)
+            try:
+                user.set_password(password)
+            except HashingBusy:
+                flash('We are handling a lot of sign-ups right now. Please try again in a moment.', 'warning')
+                return render_template('auth/register.html', title='Register'), 503
 
             db.session.add(user)
+            invalidate(HOME_STATS)
             db.session.commit()
 
             # Auto login after registration
             login_user(user)
 
-            # Store user info in session
-            session['user_id'] = user.id
-            session['username'] = user.username
-            session['full_name'] = user.get_full_name()
-            session['email'] = user.email
-            session['role'] = user.role
-
             flash('Registration successful! Welcome to KUHES Campus Connect.', 'success')
             return redirect(url_for('main.home'))
 
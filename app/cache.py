@@ -0,0 +1,99 @@
+# app/cache.py - shared, stampede-safe cache for expensive aggregates
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import CacheEntry
+
+# How long one worker may spend recomputing before another may take over
+REFRESH_LEASE = timedelta(seconds=30)
+
+# Cache keys
+HOME_STATS = 'home_stats'
+FORUM_CATEGORIES = 'forum_categories'
+EVENT_COUNTS = 'event_counts'
+
+
+def get_or_compute(key, compute, ttl=None):
+    """Return the cached value for `key`, recomputing it when it has expired.
+
+    Entries live in the cache_entries table so every gunicorn worker sees the
+    same value and the same invalidations. When an entry expires, only the
+    worker that wins the refresh lease runs `compute()`; the others keep
+    serving the stale value until the new one is written. Values must be
+    JSON-serializable. Must not be called with uncommitted work in the session.
+    """
+    if ttl is None:
+        ttl = current_app.config['STATS_CACHE_TTL']
+    now = datetime.utcnow()
+
+    entry = db.session.get(CacheEntry, key)
+    if entry is None:
+        return _store_new(key, compute, ttl)
+
+    value, version = json.loads(entry.value), entry.version
+    if entry.expires_at > now:
+        return value
+
+    # Stale: try to take the refresh lease, otherwise serve the stale value
+    claimed = CacheEntry.query.filter(
+        CacheEntry.key == key,
+        CacheEntry.version == version,
+        (CacheEntry.refreshing_until.is_(None)) | (CacheEntry.refreshing_until < now)
+    ).update({CacheEntry.refreshing_until: now + REFRESH_LEASE}, synchronize_session=False)
+    db.session.commit()
+
+    if not claimed:
+        return value
+
+    try:
+        value = compute()
+    except Exception:
+        CacheEntry.query.filter_by(key=key) \
+            .update({CacheEntry.refreshing_until: None}, synchronize_session=False)
+        db.session.commit()
+        raise
+
+    # If a write invalidated the entry while we were computing, the version has
+    # moved on: keep the entry expired so the next reader recomputes
+    stored = CacheEntry.query.filter_by(key=key, version=version).update({
+        CacheEntry.value: json.dumps(value),
+        CacheEntry.expires_at: datetime.utcnow() + timedelta(seconds=ttl),
+        CacheEntry.refreshing_until: None
+    }, synchronize_session=False)
+    if not stored:
+        CacheEntry.query.filter_by(key=key) \
+            .update({CacheEntry.refreshing_until: None}, synchronize_session=False)
+    db.session.commit()
+
+    return value
+
+
+def _store_new(key, compute, ttl):
+    value = compute()
+    db.session.add(CacheEntry(
+        key=key,
+        value=json.dumps(value),
+        expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+    ))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored it first; theirs is just as fresh
+        db.session.rollback()
+    return value
+
+
+def invalidate(*keys):
+    """Expire cache entries as part of the caller's transaction (no commit).
+
+    Call this next to the write that changes the cached figures so the
+    invalidation commits (or rolls back) together with it.
+    """
+    CacheEntry.query.filter(CacheEntry.key.in_(keys)).update({
+        CacheEntry.expires_at: datetime.utcnow() - timedelta(seconds=1),
+        CacheEntry.version: CacheEntry.version + 1
+    }, synchronize_session=False)
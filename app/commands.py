@@ -0,0 +1,125 @@
+# app/commands.py - maintenance commands, run with `flask --app run <command>`
+import time
+
+import click
+from flask import current_app
+
+
+def register_commands(app):
+    """Attach the maintenance commands to the app's `flask` CLI"""
+
+    @app.cli.command('rebuild-post-counters')
+    def rebuild_post_counters():
+        """Recompute comment and reaction counters on every post."""
+        from app.models import Post
+
+        updated = Post.rebuild_counters()
+        click.echo(f'✅ Rebuilt counters for {updated} posts')
+
+    @app.cli.command('rebuild-notification-counters')
+    def rebuild_notification_counters():
+        """Recompute every user's unread notification counter."""
+        from app.models import User
+
+        updated = User.rebuild_unread_counts()
+        click.echo(f'✅ Rebuilt unread counters for {updated} users')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Rebuild the FTS5 full-text index over post titles and content."""
+        from app.search import ensure_search_index, rebuild_search_index
+
+        if not ensure_search_index():
+            click.echo('⚠️  Full-text search needs SQLite with FTS5; search uses LIKE matching')
+            return
+
+        indexed = rebuild_search_index()
+        click.echo(f'✅ Indexed {indexed} posts')
+
+    @app.cli.command('notification-worker')
+    @click.option('--batch-size', default=100, show_default=True, help='Outbox entries per transaction.')
+    @click.option('--interval', default=1.0, show_default=True, help='Seconds to wait when the outbox is empty.')
+    @click.option('--once', is_flag=True, help='Deliver what is queued now, then exit.')
+    def notification_worker(batch_size, interval, once):
+        """Deliver queued notifications from the outbox."""
+        from sqlalchemy.exc import OperationalError
+        from app import db
+        from app.outbox import process_outbox
+
+        window = current_app.config['NOTIFICATION_COALESCE_WINDOW']
+        click.echo('🔔 Notification worker started')
+        backoff = interval
+        while True:
+            try:
+                delivered, failed = process_outbox(batch_size, window)
+            except OperationalError as error:
+                # e.g. 'database is locked' - keep the worker alive and try again later
+                db.session.rollback()
+                backoff = min(max(backoff * 2, 1), 60)
+                click.echo(f'⚠️  Database error, retrying in {backoff:g}s: {error.orig}', err=True)
+                time.sleep(backoff)
+                continue
+            backoff = interval
+
+            if delivered:
+                click.echo(f'✅ Delivered {delivered} queued notifications')
+            if failed:
+                click.echo(f'⚠️  {failed} notifications failed and will be retried')
+            if not delivered and not failed:
+                if once:
+                    break
+                time.sleep(interval)
+
+    @app.cli.command('sweep-event-phases')
+    @click.option('--interval', default=None, type=float, help='Keep sweeping every N seconds.')
+    def sweep_event_phases(interval):
+        """Move events that have started or finished to their new phase."""
+        from app.lifecycle import sweep_phases
+
+        while True:
+            moved = sweep_phases()
+            if moved or interval is None:
+                click.echo(f'✅ Moved {moved} events to a new phase')
+            if interval is None:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('prune-notifications')
+    @click.option('--vacuum', type=click.Choice(['incremental', 'full']),
+                  help='Give freed space back to the filesystem afterwards (SQLite).')
+    @click.option('--pause', default=0.0, show_default=True, help='Seconds to wait between delete batches.')
+    def prune_notifications(vacuum, pause):
+        """Delete old notifications and outbox entries per the retention policies."""
+        from app.retention import run_retention
+
+        report = run_retention(current_app.config, vacuum, pause)
+        click.echo(f'🧹 Deleted {report["read_notifications"]} old read notifications')
+        click.echo(f'🧹 Deleted {report["over_user_cap"]} notifications over the per-user cap')
+        click.echo(f'🧹 Deleted {report["outbox_entries"]} delivered outbox entries')
+        if report['database_size'] is not None:
+            before, after = report['database_size']
+            click.echo(f'💾 Database file {before / 1024:.1f} KiB before, {after / 1024:.1f} KiB after '
+                       f'({max(before - after, 0) / 1024:.1f} KiB reclaimed)')
+        elif vacuum:
+            click.echo('⚠️  Vacuum is only available for SQLite databases')
+
+    @app.cli.command('sweep-sessions')
+    @click.option('--batch-size', default=500, show_default=True, help='Sessions deleted per transaction.')
+    def sweep_sessions(batch_size):
+        """Delete expired server-side sessions."""
+        deleted = current_app.session_interface.store.sweep(batch_size)
+        click.echo(f'🧹 Deleted {deleted} expired sessions')
+
+    @app.cli.command('revoke-sessions')
+    @click.argument('username')
+    def revoke_sessions(username):
+        """Sign a user out everywhere by deleting all of their sessions."""
+        from app.models import User
+
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            click.echo(f'❌ No user named {username}')
+            return
+
+        revoked = current_app.session_interface.revoke_user(user)
+        click.echo(f'✅ Revoked {revoked} sessions for {username}')
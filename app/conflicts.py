@@ -0,0 +1,196 @@
+# app/conflicts.py - venue clash detection for event bookings
+import math
+import re
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from itertools import accumulate
+
+from sqlalchemy import event as sa_event
+
+from app import db
+from app.models import Event
+
+ACTIVE_STATUSES = ('approved', 'pending')
+DEFAULT_EVENT_LENGTH = timedelta(hours=1)  # assumed length of events without an end time
+
+# Spellings that should name the same room
+VENUE_WORDS = {
+    'rm': 'room', 'rooms': 'room',
+    'lt': 'lecture theatre', 'theater': 'theatre',
+    'lab': 'laboratory', 'labs': 'laboratory',
+    'aud': 'auditorium', 'hse': 'house', 'bldg': 'building', 'blk': 'block',
+    'centre': 'center', 'ctr': 'center',
+}
+VENUE_NOISE = {'the', 'no', 'number'}
+
+
+def normalize_venue(name):
+    """Canonical form of a venue name: 'The Main Hall' and 'main-hall', or
+    'LT 1' and 'Lecture Theatre 01', give the same key"""
+    words = []
+    for word in re.findall(r'[a-z]+|[0-9]+', (name or '').lower()):
+        if word.isdigit():
+            words.append(str(int(word)))
+        elif word not in VENUE_NOISE:
+            words.append(VENUE_WORDS.get(word, word))
+    return ' '.join(words)
+
+
+def event_end(event):
+    """When `event` frees its venue"""
+    return event.end_date or event.start_date + DEFAULT_EVENT_LENGTH
+
+
+def _duration_minutes(event):
+    return max(math.ceil((event_end(event) - event.start_date).total_seconds() / 60), 1)
+
+
+@sa_event.listens_for(Event, 'before_insert')
+@sa_event.listens_for(Event, 'before_update')
+def _index_booking(mapper, connection, target):
+    target.venue_key = normalize_venue(target.venue)
+    target.duration_minutes = _duration_minutes(target)
+
+
+def rebuild_bookings(batch_size=500):
+    """Fill venue_key/duration_minutes for events saved before they existed"""
+    Event.backfill((Event.venue, Event.start_date, Event.end_date), lambda row: {
+        'venue_key': normalize_venue(row.venue),
+        'duration_minutes': _duration_minutes(row)
+    }, batch_size)
+
+
+class IntervalIndex:
+    """Static index over (start, end, item) intervals.
+
+    Intervals are sorted by start, alongside the running maximum of their
+    ends. Everything overlapping [start, end) lies between the first interval
+    whose running maximum passes `start` and the last one starting before
+    `end`, and both bounds are binary searches.
+    """
+
+    def __init__(self, intervals):
+        self._intervals = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self._starts = [interval[0] for interval in self._intervals]
+        self._reach = list(accumulate((interval[1] for interval in self._intervals), max))
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def overlapping(self, start, end):
+        first = bisect_right(self._reach, start)
+        last = bisect_left(self._starts, end)
+        return [item for item_start, item_end, item in self._intervals[first:last] if item_end > start]
+
+
+def _longest_bookings(venue_keys):
+    """venue_key -> longest event there, for the venues that have any.
+
+    One MAX(duration_minutes) per venue with an equality filter, which the
+    database answers with a single seek on the (venue_key, duration_minutes)
+    index; a GROUP BY over several venues would read every entry instead.
+    """
+    venue_keys = sorted(venue_keys)
+    if not venue_keys:
+        return {}
+    longest = db.session.execute(db.select(*[
+        db.select(db.func.max(Event.duration_minutes)).where(Event.venue_key == venue_key).scalar_subquery()
+        for venue_key in venue_keys
+    ])).one()
+    return {venue_key: timedelta(minutes=minutes)
+            for venue_key, minutes in zip(venue_keys, longest) if minutes is not None}
+
+
+def find_conflicts(venue, start, end=None, exclude_id=None, statuses=ACTIVE_STATUSES):
+    """Events in `statuses` booked into `venue` at a time overlapping [start, end).
+
+    The venue's longest booking (one index seek) bounds how far back a clash
+    can start, and the candidates are a range scan of the venue's bookings
+    starting in [start - longest, end). That range is only as narrow as the
+    longest booking is short: a single multi-day booking makes every later
+    check at that venue read the bookings of those days as well.
+    """
+    venue_key = normalize_venue(venue)
+    end = end or start + DEFAULT_EVENT_LENGTH
+    longest = _longest_bookings([venue_key]).get(venue_key)
+    if longest is None:
+        return []
+
+    candidates = Event.query.filter(
+        Event.venue_key == venue_key,
+        Event.status.in_(statuses),
+        Event.start_date < end,
+        Event.start_date > start - longest
+    ).order_by(Event.start_date)
+    return [event for event in candidates if event.id != exclude_id and event_end(event) > start]
+
+
+def conflicts_for(events, statuses=ACTIVE_STATUSES):
+    """event id -> clashing events, for many events at once (e.g. a moderation page).
+
+    Loads every booking that could clash in one query, indexes each venue
+    once and then answers each event from the index.
+    """
+    events = list(events)
+    if not events:
+        return {}
+
+    venue_keys = {normalize_venue(event.venue) for event in events}
+    longest = _longest_bookings(venue_keys)
+    if not longest:
+        return {}
+
+    window_start = min(event.start_date for event in events) - max(longest.values())
+    window_end = max(event_end(event) for event in events)
+    bookings = Event.query.filter(
+        Event.venue_key.in_(venue_keys),
+        Event.status.in_(statuses),
+        Event.start_date < window_end,
+        Event.start_date > window_start
+    )
+
+    by_venue = {}
+    for booking in bookings:
+        by_venue.setdefault(booking.venue_key, []).append((booking.start_date, event_end(booking), booking))
+    indexes = {venue_key: IntervalIndex(intervals) for venue_key, intervals in by_venue.items()}
+
+    conflicts = {}
+    for event in events:
+        index = indexes.get(normalize_venue(event.venue))
+        if index is None:
+            continue
+        clashes = [other for other in index.overlapping(event.start_date, event_end(event)) if other.id != event.id]
+        if clashes:
+            conflicts[event.id] = clashes
+    return conflicts
+
+
+def conflict_report(start, end, statuses=ACTIVE_STATUSES):
+    """Every clashing pair of bookings starting in [start, end), grouped by venue.
+
+    Returns [(venue name, [(event, other), ...]), ...], busiest venue first.
+    """
+    events = Event.query.filter(
+        Event.status.in_(statuses),
+        Event.start_date >= start,
+        Event.start_date < end
+    ).all()
+
+    by_venue = {}
+    for event in events:
+        by_venue.setdefault(event.venue_key or normalize_venue(event.venue), []).append(event)
+
+    report = []
+    for venue_events in by_venue.values():
+        index = IntervalIndex([(event.start_date, event_end(event), event) for event in venue_events])
+        pairs = [
+            (event, other)
+            for event in sorted(venue_events, key=lambda event: (event.start_date, event.id))
+            for other in index.overlapping(event.start_date, event_end(event))
+            if (other.start_date, other.id) > (event.start_date, event.id)
+        ]
+        if pairs:
+            report.append((venue_events[0].venue, pairs))
+
+    report.sort(key=lambda entry: len(entry[1]), reverse=True)
+    return report
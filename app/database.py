@@ -0,0 +1,151 @@
+# app/database.py - database URI, engine options, SQLite tuning and read/write routing
+import os
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+READ_BIND = 'read'  # SQLALCHEMY_BINDS key of the read-only engine
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+PRIMARY_COOKIE = 'read_primary'  # set after a write so the next reads see it
+
+
+def env_setting(name, default, cast=str):
+    """Config value from the environment variable `name`, else `default`"""
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return cast(value)
+
+
+def database_uri(uri=None, default='sqlite:///kuhes.db'):
+    """`uri`, else $DATABASE_URL, else `default` (postgres:// is accepted for postgresql://)"""
+    uri = uri or env_setting('DATABASE_URL', default)
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def read_database_uri(uri):
+    """Where read-only requests should read from, or None to read from `uri`.
+
+    $DATABASE_READ_URL names a replica ('off' turns routing off). Without one, a file-based SQLite
+    database is opened a second time in read-only mode (mode=ro), which under
+    WAL gives readers their own connection pool that never waits on the
+    writer.
+    """
+    replica = env_setting('DATABASE_READ_URL', None)
+    if replica and replica.lower() == 'off':
+        return None
+    if replica:
+        return database_uri(replica)
+
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:') \
+            or url.database.startswith('file:'):
+        return None
+    return f'sqlite:///file:{url.database}?mode=ro&uri=true'
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+
+    SQLite gets the busy timeout on the driver (the pragmas are added by
+    install_sqlite_pragmas); server databases get a sized, recycled,
+    pre-pinged connection pool per process.
+    """
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite':
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT']}}
+
+    return {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def sqlite_pragmas(config, read_only=False):
+    """The PRAGMA statements run on each new SQLite connection"""
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT'] * 1000)}",
+        f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+    ]
+    if config['SQLITE_JOURNAL_MODE'] and not read_only:  # the journal mode is set by the writer
+        pragmas.insert(0, f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+    return pragmas
+
+
+def install_sqlite_pragmas(engine, config, read_only=False):
+    """Run sqlite_pragmas() whenever `engine` opens a connection (no-op for other databases).
+
+    WAL lets readers carry on while one process writes, and busy_timeout
+    makes a writer wait for the lock instead of failing straight away with
+    'database is locked'. synchronous=NORMAL is safe under WAL and avoids an
+    fsync per commit.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = sqlite_pragmas(config, read_only)
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+class RoutingSession(Session):
+    """db.session that sends the reads of read-only requests to the read engine.
+
+    A SELECT goes to the READ_BIND engine when the request is routed there
+    (see init_read_routing) and the session has not written anything yet.
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary,
+    and once a session has written, the rest of its statements follow, so a
+    request always reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and READ_BIND in self._db.engines:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['wrote'] = True
+            elif getattr(clause, 'is_select', False) and not self.info.get('wrote') \
+                    and has_request_context() and g.get('read_from_replica', False):
+                return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_read_routing(app, db):
+    """Route GET/HEAD/OPTIONS requests' reads to the read engine, if there is one.
+
+    After a successful request that wrote anything - a POST, or a GET such as
+    /notifications that marks rows read - the browser gets a short-lived
+    cookie that keeps its reads on the primary for DATABASE_READ_YOUR_WRITES
+    seconds, so the next page never shows a replica that has not caught up
+    yet.
+    """
+    with app.app_context():
+        if READ_BIND not in db.engines:
+            return
+        install_sqlite_pragmas(db.engines[READ_BIND], app.config, read_only=True)
+
+    @app.before_request
+    def _choose_engine():
+        g.read_from_replica = request.method in READ_METHODS and PRIMARY_COOKIE not in request.cookies
+
+    @app.after_request
+    def _pin_to_primary(response):
+        window = app.config['DATABASE_READ_YOUR_WRITES']
+        # Checked here, before teardown removes the session and its info
+        if window and db.session.info.get('wrote') and response.status_code < 400:
+            response.set_cookie(PRIMARY_COOKIE, '1', max_age=int(window), httponly=True, samesite='Lax',
+                                secure=app.config['SESSION_COOKIE_SECURE'])
+        return response
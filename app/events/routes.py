@@ -1,8 +1,15 @@
 # app/events/routes.py - COMPLETE FIXED FILE
-from flask import render_template, flash, redirect, url_for, request, session, jsonify
+from flask import render_template, flash, redirect, url_for, request, session, jsonify, current_app
 from flask_login import login_required, current_user
-from app.models import db, Event, User
-from datetime import datetime, timedelta
+from app.models import db, Event, User, NotificationOutbox
+from app.cache import get_or_compute, invalidate, HOME_STATS, EVENT_COUNTS
+from app.pagination import paginate
+from app.ical import serve_feed, user_feed_token, user_id_from_token
+from app.conflicts import find_conflicts, conflicts_for, conflict_report
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timedelta, timezone
+import hashlib
+import json
 
 # Import events_bp from the events package
 from app.events import events_bp
@@ -26,31 +33,33 @@ def events_home():
     if filter_category != 'all':
         query = query.filter_by(category=filter_category)
 
-    # Date filtering
-    today = datetime.utcnow().date()
+    # Date filtering - half-open ranges on start_date itself so the
+    # (status, start_date) index can be used
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    tomorrow = today + timedelta(days=1)
     if filter_date == 'today':
-        query = query.filter(db.func.date(Event.start_date) == today)
+        query = query.filter(Event.start_date >= today, Event.start_date < tomorrow)
     elif filter_date == 'week':
-        week_end = today + timedelta(days=7)
-        query = query.filter(db.func.date(Event.start_date).between(today, week_end))
+        query = query.filter(Event.start_date >= today, Event.start_date < tomorrow + timedelta(days=7))
     elif filter_date == 'month':
-        month_end = today + timedelta(days=30)
-        query = query.filter(db.func.date(Event.start_date).between(today, month_end))
+        query = query.filter(Event.start_date >= today, Event.start_date < tomorrow + timedelta(days=30))
+    elif filter_date == 'ongoing':
+        query = query.filter(Event.phase == 'ongoing')
     elif filter_date == 'past':
-        query = query.filter(db.func.date(Event.start_date) < today)
-    else:  # upcoming (default)
-        query = query.filter(db.func.date(Event.start_date) >= today)
+        query = query.filter(Event.phase == 'past')
+    elif filter_date != 'all':  # upcoming (default) - includes events already under way
+        query = query.filter(Event.phase.in_(['upcoming', 'ongoing']))
 
-    # Order by date
-    events = query.order_by(Event.start_date.asc()).all()
+    # Soonest first, a page at a time
+    events = paginate(query, Event.start_date, Event.id, per_page=12, descending=False)
 
-    # Calculate counts for stats
-    upcoming_count = Event.query.filter_by(status='approved') \
-        .filter(Event.start_date >= datetime.utcnow()).count()
+    # Stats come from the cache; event writes invalidate EVENT_COUNTS
+    counts = get_event_counts()
 
-    approved_count = Event.query.filter_by(status='approved').count()
-
-    pending_count = Event.query.filter_by(status='pending').count()
+    # "Happening now" strip - one lookup on (status, phase, start_date)
+    ongoing_events = Event.query.filter_by(status='approved', phase='ongoing') \
+        .order_by(Event.start_date.asc()) \
+        .limit(6).all()
 
     return render_template('events/home.html',
                            events=events,
@@ -58,12 +67,31 @@ def events_home():
                            filter_type=filter_type,
                            filter_category=filter_category,
                            filter_date=filter_date,
-                           upcoming_count=upcoming_count,
-                           approved_count=approved_count,
-                           pending_count=pending_count,
+                           ongoing_events=ongoing_events,
+                           upcoming_count=counts['upcoming'],
+                           approved_count=counts['approved'],
+                           pending_count=counts['pending'],
                            now=datetime.utcnow().date())
 
 
+def compute_event_counts():
+    """Upcoming/approved/pending totals for the events page (cached under EVENT_COUNTS)"""
+    rows = db.session.query(Event.status, Event.phase, db.func.count(Event.id)) \
+        .filter(Event.status.in_(['approved', 'pending'])) \
+        .group_by(Event.status, Event.phase).all()
+
+    counts = {'upcoming': 0, 'approved': 0, 'pending': 0}
+    for status, phase, count in rows:
+        counts[status] += count
+        if status == 'approved' and phase == 'upcoming':
+            counts['upcoming'] += count
+    return counts
+
+
+def get_event_counts():
+    return get_or_compute(EVENT_COUNTS, compute_event_counts)
+
+
 @events_bp.route('/create', methods=['GET', 'POST'])
 @login_required
 def create_event():
@@ -128,10 +156,17 @@ def create_event():
                 user_id=current_user.id
             )
 
+            clashes = find_conflicts(venue, start_datetime, end_datetime)
+
             db.session.add(event)
+            invalidate(EVENT_COUNTS)
             db.session.commit()
 
             flash('Event submitted successfully! It will be reviewed by leadership.', 'success')
+            if clashes:
+                titles = ', '.join(f'"{clash.title}"' for clash in clashes[:3])
+                flash(f'Heads up: {venue} is already booked at that time ({titles}). '
+                      f'Moderators will see the clash when reviewing your event.', 'warning')
             return redirect(url_for('events.my_events'))
 
     return render_template('events/create.html', now=datetime.utcnow().date())
@@ -145,26 +180,96 @@ def my_events():
         .order_by(Event.created_at.desc()) \
         .all()
 
-    return render_template('events/my_events.html', events=events, user=current_user)
+    return render_template('events/my_events.html', events=events, user=current_user,
+                           ical_token=user_feed_token(current_user))
 
 
 @events_bp.route('/pending')
 @login_required
 def pending_events():
-    """Show pending events (admin/leader only)"""
+    """Show pending events (admin/leader only), oldest submission first"""
     if not current_user.can_approve_events():
         flash('You do not have permission to access this page', 'danger')
         return redirect(url_for('events.events_home'))
 
-    pending_events = Event.query.filter_by(status='pending') \
-        .order_by(Event.created_at.asc()) \
-        .all()
+    query = Event.query.filter_by(status='pending').options(joinedload(Event.organizer))
+    pending_events = paginate(query, Event.created_at, Event.id, per_page=25, descending=False)
 
     return render_template('events/pending.html',
                            events=pending_events,
+                           pending_count=get_event_counts()['pending'],
+                           conflicts=conflicts_for(pending_events.items),
+                           user=current_user)
+
+
+@events_bp.route('/conflicts')
+@login_required
+def venue_conflicts():
+    """Venue double-bookings among approved and pending events in a date range"""
+    if not current_user.can_approve_events():
+        flash('You do not have permission to access this page', 'danger')
+        return redirect(url_for('events.events_home'))
+
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') \
+            else datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('end') \
+            else start + timedelta(days=120)
+    except ValueError:
+        flash('Invalid date format', 'danger')
+        return redirect(url_for('events.venue_conflicts'))
+
+    return render_template('events/conflicts.html',
+                           report=conflict_report(start, end),
+                           start=start, end=end - timedelta(days=1),
                            user=current_user)
 
 
+def conflict_summary(clashes):
+    return [{'id': clash.id, 'title': clash.title, 'venue': clash.venue,
+             'start': clash.start_date.isoformat(),
+             'end': clash.end_date.isoformat() if clash.end_date else None}
+            for clash in clashes]
+
+
+def approve(event, moderator):
+    """Mark `event` approved and queue the organizer's notification (no commit)"""
+    event.status = 'approved'
+    event.approved_by = moderator.id
+    event.approved_at = datetime.utcnow()
+    event.rejection_reason = None
+
+    if event.user_id != moderator.id:
+        NotificationOutbox.enqueue(
+            idempotency_key=f'event_approval:{event.id}',
+            user_id=event.user_id,
+            actor=moderator,
+            title='Event Approved',
+            message=f'Your event "{event.title[:50]}" was approved and is now listed',
+            notification_type='event_approval',
+            related_id=event.id
+        )
+
+
+def reject(event, moderator, reason):
+    """Mark `event` rejected and queue the organizer's notification (no commit)"""
+    event.status = 'rejected'
+    event.approved_by = moderator.id
+    event.approved_at = datetime.utcnow()
+    event.rejection_reason = reason
+
+    if event.user_id != moderator.id:
+        NotificationOutbox.enqueue(
+            idempotency_key=f'event_rejection:{event.id}',
+            user_id=event.user_id,
+            actor=moderator,
+            title='Event Not Approved',
+            message=f'Your event "{event.title[:50]}" was not approved: {reason[:200]}',
+            notification_type='event_rejection',
+            related_id=event.id
+        )
+
+
 @events_bp.route('/approve/<int:event_id>', methods=['POST'])
 @login_required
 def approve_event(event_id):
@@ -177,12 +282,18 @@ def approve_event(event_id):
     if event.status != 'pending':
         return jsonify({'success': False, 'error': 'Event is not pending'}), 400
 
-    # Approve the event
-    event.status = 'approved'
-    event.approved_by = current_user.id
-    event.approved_at = datetime.utcnow()
-    event.rejection_reason = None
-
+    # Don't double-book a venue unless the moderator confirms it
+    clashes = find_conflicts(event.venue, event.start_date, event.end_date,
+                             exclude_id=event.id, statuses=('approved',))
+    if clashes and not (request.get_json(silent=True) or {}).get('force'):
+        return jsonify({
+            'success': False,
+            'error': f'{event.venue} is already booked at that time',
+            'conflicts': conflict_summary(clashes)
+        }), 409
+
+    approve(event, current_user)
+    invalidate(HOME_STATS, EVENT_COUNTS)
     db.session.commit()
 
     return jsonify({
@@ -208,12 +319,8 @@ def reject_event(event_id):
     if not rejection_reason:
         return jsonify({'success': False, 'error': 'Rejection reason is required'}), 400
 
-    # Reject the event
-    event.status = 'rejected'
-    event.approved_by = current_user.id
-    event.approved_at = datetime.utcnow()
-    event.rejection_reason = rejection_reason
-
+    reject(event, current_user, rejection_reason)
+    invalidate(EVENT_COUNTS)
     db.session.commit()
 
     return jsonify({
@@ -222,31 +329,153 @@ def reject_event(event_id):
     })
 
 
+@events_bp.route('/moderate', methods=['POST'])
+@login_required
+def moderate_events():
+    """Approve or reject many events in one transaction (admin/leader only)"""
+    if not current_user.can_approve_events():
+        return jsonify({'success': False, 'error': 'Not authorized'}), 403
+
+    # {"action": "approve" | "reject", "ids": [...], "reason": "...", "force": false}
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    reason = (data.get('reason') or '').strip()
+    try:
+        ids = list(dict.fromkeys(int(event_id) for event_id in data.get('ids') or []))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'ids must be a list of event ids'}), 400
+
+    limit = current_app.config['MODERATION_BATCH_LIMIT']
+    if action not in ('approve', 'reject'):
+        return jsonify({'success': False, 'error': 'action must be "approve" or "reject"'}), 400
+    if not ids or len(ids) > limit:
+        return jsonify({'success': False, 'error': f'Send between 1 and {limit} event ids'}), 400
+    if action == 'reject' and not reason:
+        return jsonify({'success': False, 'error': 'Rejection reason is required'}), 400
+
+    events = {event.id: event for event in Event.query.filter(Event.id.in_(ids))}
+    pending = sorted((event for event in events.values() if event.status == 'pending'),
+                     key=lambda event: (event.start_date, event.id))
+
+    # Clashes with anything approved so far - including earlier ids in this batch,
+    # since approving them updates the same objects
+    clashes = conflicts_for(pending) if action == 'approve' and not data.get('force') else {}
+
+    results = {}
+    for event in pending:
+        if action == 'reject':
+            reject(event, current_user, reason)
+            results[event.id] = {'status': 'rejected'}
+            continue
+
+        approved_clashes = [other for other in clashes.get(event.id, []) if other.status == 'approved']
+        if approved_clashes:
+            results[event.id] = {'status': 'conflict', 'conflicts': conflict_summary(approved_clashes)}
+        else:
+            approve(event, current_user)
+            results[event.id] = {'status': 'approved'}
+
+    done = sum(1 for result in results.values() if result['status'] in ('approved', 'rejected'))
+    if done:
+        invalidate(HOME_STATS, EVENT_COUNTS)
+    db.session.commit()
+
+    return jsonify({
+        'success': True,
+        'processed': done,
+        'results': [
+            {'id': event_id, **results.get(event_id, {'status': 'not_found' if event_id not in events else 'not_pending'})}
+            for event_id in ids
+        ]
+    })
+
+
 @events_bp.route('/calendar')
 def events_calendar():
-    """Events calendar view"""
-    # Get all approved events
-    events = Event.query.filter_by(status='approved') \
-        .filter(Event.start_date >= datetime.utcnow()) \
-        .order_by(Event.start_date.asc()) \
-        .all()
-
-    # Format events for calendar
-    calendar_events = []
-    for event in events:
-        calendar_events.append({
-            'id': event.id,
-            'title': event.title,
-            'start': event.start_date.isoformat(),
-            'end': event.end_date.isoformat() if event.end_date else None,
-            'url': f"/events/{event.id}",
-            'color': get_event_color(event.event_type),
-            'description': event.description[:100] + '...' if len(event.description) > 100 else event.description
-        })
-
-    return render_template('events/calendar.html',
-                           calendar_events=calendar_events,
-                           user=current_user)
+    """Events calendar view - events are fetched month by month from calendar_feed"""
+    return render_template('events/calendar.html', user=current_user)
+
+
+def parse_window_bound(value):
+    """ISO 8601 date/datetime from the calendar widget as naive UTC"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+@events_bp.route('/calendar/feed')
+def calendar_feed():
+    """Approved events overlapping ?start=...&end=... as JSON (for the calendar widget)"""
+    try:
+        window_start = parse_window_bound(request.args['start'])
+        window_end = parse_window_bound(request.args['end'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'start and end must be ISO 8601 dates'}), 400
+
+    max_window = current_app.config['CALENDAR_MAX_WINDOW']
+    if not window_start < window_end <= window_start + max_window:
+        return jsonify({'success': False, 'error': f'The window must be under {max_window.days} days'}), 400
+
+    columns = (Event.id, Event.title, Event.event_type, Event.start_date, Event.end_date)
+    # Events starting in the window, plus earlier ones still running when it opens - which
+    # started at most the longest approved event's duration before it
+    query = Event.query.with_entities(*columns).filter(
+        Event.status == 'approved', Event.start_date >= window_start, Event.start_date < window_end)
+    longest = db.session.query(db.func.max(Event.duration_minutes)).filter(Event.status == 'approved').scalar()
+    if longest:
+        query = query.union_all(Event.query.with_entities(*columns).filter(
+            Event.status == 'approved',
+            Event.start_date >= window_start - timedelta(minutes=longest),
+            Event.start_date < window_start,
+            Event.end_date > window_start))
+    rows = sorted(query.all(), key=lambda row: (row.start_date, row.id))
+
+    calendar_events = [{
+        'id': row.id,
+        'title': row.title,
+        'start': row.start_date.isoformat(),
+        'end': row.end_date.isoformat() if row.end_date else None,
+        'url': url_for('events.view_event', event_id=row.id),
+        'color': get_event_color(row.event_type)
+    } for row in rows]
+
+    response = jsonify(calendar_events)
+    # No Last-Modified: the newest updated_at in a window goes backwards when an event leaves it
+    response.set_etag(hashlib.sha1(json.dumps(calendar_events, sort_keys=True).encode()).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@events_bp.route('/calendar.ics')
+def ical_all():
+    """Subscribable iCalendar feed of all approved events"""
+    return serve_feed('all', 'KUHES Events', [Event.status == 'approved'])
+
+
+@events_bp.route('/types/<event_type>.ics')
+def ical_by_type(event_type):
+    """iCalendar feed of approved events of one type"""
+    return serve_feed(f'type:{event_type}', f'KUHES {event_type.title()} Events',
+                      [Event.status == 'approved', Event.event_type == event_type])
+
+
+@events_bp.route('/categories/<category>.ics')
+def ical_by_category(category):
+    """iCalendar feed of approved events in one category"""
+    return serve_feed(f'category:{category}', f'KUHES Events - {category}',
+                      [Event.status == 'approved', Event.category == category])
+
+
+@events_bp.route('/my/<token>.ics')
+def ical_my_events(token):
+    """iCalendar feed of one user's approved and pending events, addressed by a signed token"""
+    user_id = user_id_from_token(token)
+    if user_id is None:
+        return jsonify({'success': False, 'error': 'Unknown calendar feed'}), 404
+    return serve_feed(f'user:{user_id}', 'My KUHES Events',
+                      [Event.user_id == user_id, Event.status.in_(['approved', 'pending'])], private=True)
 
 
 @events_bp.route('/<int:event_id>')
@@ -279,6 +508,7 @@ def delete_event(event_id):
         return jsonify({'success': False, 'error': 'Not authorized'}), 403
 
     db.session.delete(event)
+    invalidate(HOME_STATS, EVENT_COUNTS)
     db.session.commit()
 
     return jsonify({'success': True, 'message': 'Event deleted successfully'})
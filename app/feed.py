@@ -0,0 +1,44 @@
+# app/feed.py - shared query layer for post feeds (home, news, forum, search, profiles)
+from sqlalchemy.orm import joinedload
+
+from app.models import Post, PostReaction
+
+
+def feed_query():
+    """Posts newest first, with each author loaded in the same SELECT.
+
+    Comment and reaction totals live on the post row itself (see the counter
+    columns on Post), so a feed card needs no further queries for them.
+    """
+    return Post.query.options(joinedload(Post.author)) \
+        .order_by(Post.created_at.desc(), Post.id.desc())
+
+
+def viewer_reactions(post_ids, viewer):
+    """Map post id -> the viewer's reaction type for `post_ids`, in one query.
+
+    Anonymous viewers get an empty dict without touching the database.
+    """
+    if not post_ids or viewer is None or not viewer.is_authenticated:
+        return {}
+
+    rows = PostReaction.query \
+        .with_entities(PostReaction.post_id, PostReaction.reaction_type) \
+        .filter(PostReaction.user_id == viewer.id,
+                PostReaction.post_id.in_(post_ids)) \
+        .all()
+    return dict(rows)
+
+
+def load_viewer_reactions(posts, viewer):
+    """Set post.viewer_reaction on every post using a single query.
+
+    `posts` may be a list or a Flask-SQLAlchemy pagination object.
+    """
+    posts = list(getattr(posts, 'items', posts))
+    reactions = viewer_reactions([post.id for post in posts], viewer)
+
+    for post in posts:
+        post.viewer_reaction = reactions.get(post.id)
+
+    return posts
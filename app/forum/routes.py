@@ -1,8 +1,12 @@
 
 # app/forum/routes.py - FIXED
-from flask import render_template, request
+from flask import render_template, request, current_app, jsonify
 from flask_login import current_user
 from app.models import Post, Comment
+from app.feed import feed_query, load_viewer_reactions
+from app.pagination import paginate
+from app.search import search_posts
+from app.cache import get_or_compute, FORUM_CATEGORIES
 from app import db
 
 # Import forum_bp from the forum package
@@ -14,16 +18,15 @@ from app.forum import forum_bp
 @forum_bp.route('/')
 def forum_home():
     category = request.args.get('category', 'all')
-    page = request.args.get('page', 1, type=int)
     per_page = 10
 
-    query = Post.query
+    query = feed_query()
 
     if category != 'all':
-        query = query.filter_by(category=category)
+        query = query.filter(Post.category == category)
 
-    posts = query.order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
+    posts = paginate(query, Post.created_at, Post.id, per_page)
+    load_viewer_reactions(posts, current_user)
 
     return render_template('forum/home.html',
                            posts=posts,
@@ -31,39 +34,57 @@ def forum_home():
                            user=current_user)
 
 
+def compute_category_counts():
+    """Post count per category in one GROUP BY (cached under FORUM_CATEGORIES)"""
+    rows = db.session.query(Post.category, db.func.count(Post.id)) \
+        .filter(Post.category.isnot(None), Post.category != '') \
+        .group_by(Post.category) \
+        .order_by(Post.category) \
+        .all()
+    return dict(rows)
+
+
+def get_category_counts():
+    return get_or_compute(FORUM_CATEGORIES, compute_category_counts)
+
+
 @forum_bp.route('/categories')
 def categories():
-    # Get all unique categories from posts
-    categories = db.session.query(Post.category).distinct().all()
-    category_list = [cat[0] for cat in categories if cat[0]]
-
-    # Get post count per category
-    category_counts = {}
-    for category in category_list:
-        count = Post.query.filter_by(category=category).count()
-        category_counts[category] = count
+    category_counts = get_category_counts()
 
     return render_template('forum/categories.html',
-                           categories=category_list,
+                           categories=list(category_counts),
                            category_counts=category_counts,
                            user=current_user)
 
 
+@forum_bp.route('/categories/counts')
+def category_counts():
+    """Post count per category (for AJAX - forum sidebar)"""
+    counts = get_category_counts()
+
+    return jsonify({
+        'categories': counts,
+        'total': sum(counts.values())
+    })
+
+
 @forum_bp.route('/search')
 def search():
     query = request.args.get('q', '')
-    page = request.args.get('page', 1, type=int)
     per_page = 10
 
-    if query:
-        posts = Post.query.filter(
+    if query and current_app.config.get('SEARCH_FTS_ENABLED'):
+        # Ranked full-text search (BM25) with highlighted snippets
+        posts = search_posts(query, request.args.get('cursor'), per_page, request.args.get('page', type=int))
+    elif query:
+        posts = paginate(feed_query().filter(
             (Post.title.ilike(f'%{query}%')) |
             (Post.content.ilike(f'%{query}%'))
-        ).order_by(Post.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False)
+        ), Post.created_at, Post.id, per_page)
     else:
-        posts = Post.query.order_by(Post.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False)
+        posts = paginate(feed_query(), Post.created_at, Post.id, per_page)
+    load_viewer_reactions(posts, current_user)
 
     return render_template('forum/search.html',
                            posts=posts,
@@ -0,0 +1,179 @@
+# app/ical.py - iCalendar (.ics) feeds, streamed from the database and cached on disk
+import glob
+import hashlib
+import os
+from datetime import datetime
+
+from flask import Response, current_app, request, send_file, stream_with_context, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+from werkzeug.http import is_resource_modified
+
+from app import db
+from app.models import Event, User
+
+ROWS_PER_FETCH = 200
+FEED_COLUMNS = (Event.id, Event.title, Event.description, Event.event_type, Event.venue,
+                Event.start_date, Event.end_date, Event.updated_at, Event.status)
+STATUSES = {'approved': 'CONFIRMED', 'pending': 'TENTATIVE'}
+
+
+def _escape(text):
+    """Escape a TEXT value (RFC 5545 3.3.11)"""
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+
+
+def _fold(line):
+    """Fold a content line into 75-octet pieces, as calendar clients expect"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    pieces, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1  # never split a multi-byte character
+        pieces.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, 74  # continuation lines start with a space
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def _local(moment):
+    # Event times are campus wall-clock times, so they go out as floating times
+    return moment.strftime('%Y%m%dT%H%M%S')
+
+
+def _vevent(row, host):
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{row.id}@{host}',
+        f'DTSTAMP:{(row.updated_at or datetime.utcnow()).strftime("%Y%m%dT%H%M%SZ")}',
+        f'DTSTART:{_local(row.start_date)}',
+    ]
+    if row.end_date:
+        lines.append(f'DTEND:{_local(row.end_date)}')
+    lines += [
+        f'SUMMARY:{_escape(row.title)}',
+        f'LOCATION:{_escape(row.venue)}',
+        f'DESCRIPTION:{_escape(row.description)}',
+        f'CATEGORIES:{_escape(row.event_type)}',
+        f'STATUS:{STATUSES.get(row.status, "CONFIRMED")}',
+        f'URL:{url_for("events.view_event", event_id=row.id, _external=True)}',
+        'END:VEVENT',
+    ]
+    return ''.join(_fold(line) for line in lines)
+
+
+def render_feed(name, filters):
+    """Yield the calendar for events matching `filters`, a few rows at a time.
+
+    Rows come from a streaming cursor, so the feed is never held in memory.
+    """
+    host = request.host.split(':')[0]
+    yield ''.join(_fold(line) for line in (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//KUHES Campus Connect//Events//EN',
+        'CALSCALE:GREGORIAN', 'METHOD:PUBLISH', f'X-WR-CALNAME:{_escape(name)}'))
+
+    statement = db.select(*FEED_COLUMNS).where(*filters).order_by(Event.start_date, Event.id)
+    with db.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=ROWS_PER_FETCH) \
+            .execute(statement)
+        for rows in result.partitions():
+            yield ''.join(_vevent(row, host) for row in rows)
+
+    yield 'END:VCALENDAR\r\n'
+
+
+def feed_version(filters):
+    """(latest updated_at, row count) for the events in a feed.
+
+    The count catches deletions, which leave no newer updated_at behind - so
+    the pair is only usable as an ETag, never as a Last-Modified date.
+    """
+    return db.session.query(db.func.max(Event.updated_at), db.func.count(Event.id)) \
+        .filter(*filters).one()
+
+
+def _write_through(chunks, path):
+    """Pass `chunks` on while copying them to `path`; the file only appears once complete"""
+    temporary = f'{path}.{os.getpid()}.{id(chunks)}.tmp'
+    try:
+        with open(temporary, 'w', encoding='utf-8', newline='') as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+                yield chunk
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    # Earlier versions of this feed are now stale
+    prefix = path.rsplit('.', 2)[0]
+    for stale in glob.glob(f'{glob.escape(prefix)}.*.ics'):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def serve_feed(key, name, filters, private=False):
+    """Respond with the .ics feed for `filters`, identified by `key`.
+
+    Only a version check hits the database: an unchanged feed is answered
+    with 304 (If-None-Match only; see feed_version), or from the copy cached
+    in ICAL_CACHE_DIR. A changed feed is streamed to the client and to a new
+    cache file at the same time. Empty feeds are never cached, so made-up
+    keys (/events/types/<anything>.ics) cannot fill the disk.
+    """
+    latest, count = feed_version(filters)
+    version = hashlib.sha1(f'{key}|{latest}|{count}'.encode()).hexdigest()[:16]
+
+    directory = current_app.config['ICAL_CACHE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{hashlib.sha1(key.encode()).hexdigest()[:16]}.{version}.ics')
+
+    if not is_resource_modified(request.environ, etag=version):
+        response = Response(status=304)
+    elif not count:
+        response = Response(''.join(render_feed(name, filters)), mimetype='text/calendar')
+    elif os.path.exists(path):
+        response = send_file(path, mimetype='text/calendar', conditional=False, etag=False, max_age=None)
+    else:
+        chunks = _write_through(render_feed(name, filters), path)
+        response = Response(stream_with_context(chunks), mimetype='text/calendar')
+
+    response.set_etag(version)
+    response.cache_control.max_age = current_app.config['ICAL_MAX_AGE']
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='events-ical')
+
+
+def user_feed_token(user):
+    """Unguessable token for a user's own-events feed (calendar apps cannot log in).
+
+    It carries the user's session_version, so signing them out everywhere
+    (flask revoke-sessions) also retires feed URLs that have leaked.
+    """
+    return _serializer().dumps([user.id, user.session_version or 0])
+
+
+def user_id_from_token(token):
+    """The user id a feed token was made for, or None if it is not genuine or has been revoked"""
+    try:
+        user_id, version = _serializer().loads(token)
+    except (BadSignature, TypeError, ValueError):
+        return None
+    if not isinstance(user_id, int):
+        return None
+    current = db.session.query(User.session_version).filter(User.id == user_id).scalar()
+    if current is None or current != version:
+        return None
+    return user_id
@@ -0,0 +1,65 @@
+# app/lifecycle.py - stored event phases (upcoming -> ongoing -> past) and their sweeper
+from datetime import datetime, timedelta
+
+from sqlalchemy import event as sa_event
+
+from app import db
+from app.cache import invalidate, EVENT_COUNTS, HOME_STATS
+from app.models import Event
+
+PHASES = ('upcoming', 'ongoing', 'past')
+
+
+def phase_at(start_date, end_date, now):
+    """(phase, when it next changes) for an event at `now`.
+
+    An event without an end time runs until the end of its start day. Past
+    events never change again, so their boundary is None.
+    """
+    ends_at = end_date or datetime.combine(start_date.date(), datetime.min.time()) + timedelta(days=1)
+    if now < start_date:
+        return 'upcoming', start_date
+    if now < ends_at:
+        return 'ongoing', ends_at
+    return 'past', None
+
+
+@sa_event.listens_for(Event, 'before_insert')
+@sa_event.listens_for(Event, 'before_update')
+def _set_phase(mapper, connection, target):
+    target.phase, target.phase_changes_at = phase_at(target.start_date, target.end_date, datetime.utcnow())
+
+
+def _phase_values(row, now):
+    """The phase columns at `now` for an (id, start_date, end_date) row"""
+    phase, changes_at = phase_at(row.start_date, row.end_date, now)
+    return {'phase': phase, 'phase_changes_at': changes_at}
+
+
+def sweep_phases(batch_size=500, now=None):
+    """Move events whose phase boundary has passed on to their next phase.
+
+    Only rows with phase_changes_at <= now are read, straight off the
+    ix_events_phase_changes_at index, so a sweep over a large archive
+    touches just the events that started or finished since the last one.
+    Returns the number of events moved.
+    """
+    now = now or datetime.utcnow()
+    moved = 0
+    while True:
+        rows = db.session.query(Event.id, Event.start_date, Event.end_date) \
+            .filter(Event.phase_changes_at <= now) \
+            .order_by(Event.phase_changes_at).limit(batch_size).all()
+        if not rows:
+            return moved
+
+        Event.update_many([{'id': row.id, **_phase_values(row, now)} for row in rows])
+        invalidate(EVENT_COUNTS, HOME_STATS)
+        db.session.commit()
+        moved += len(rows)
+
+
+def rebuild_phases(batch_size=500):
+    """Fill phase/phase_changes_at for events saved before they existed"""
+    now = datetime.utcnow()
+    Event.backfill((Event.start_date, Event.end_date), lambda row: _phase_values(row, now), batch_size)
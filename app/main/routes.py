@@ -1,9 +1,16 @@
 # app/main/routes.py - FIXED
-from flask import render_template, flash, redirect, url_for, request, session, jsonify
+from flask import render_template, flash, redirect, url_for, request, session, jsonify, current_app, \
+    Response, stream_with_context
 from flask_login import login_required, current_user
-from app.models import Post, User, Comment, PostReaction
+from app.models import Post, User, Comment, PostReaction, NotificationOutbox, REACTION_TYPES
+from app.feed import feed_query, load_viewer_reactions, viewer_reactions
+from app.pagination import paginate
+from app.cache import get_or_compute, invalidate, HOME_STATS, FORUM_CATEGORIES
+from app.notify import broker, event_stream, mark_changed, poller
 from app import db
 from datetime import datetime
+import hashlib
+import json
 
 # Import main_bp from the main package
 from app.main import main_bp
@@ -19,21 +26,15 @@ from app.models import Notification
 @login_required
 def notifications():
     """View all notifications"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
 
-    notifications = Notification.query.filter_by(user_id=current_user.id) \
-        .order_by(Notification.created_at.desc()) \
-        .paginate(page=page, per_page=per_page, error_out=False)
-
-    # Mark as read when viewing
-    unread_notifications = Notification.query.filter_by(
-        user_id=current_user.id, is_read=False
-    ).all()
-
-    for notification in unread_notifications:
-        notification.is_read = True
+    notifications = paginate(Notification.query.filter_by(user_id=current_user.id)
+                             .order_by(Notification.created_at.desc(), Notification.id.desc()),
+                             Notification.created_at, Notification.id, per_page)
 
+    # Mark as read when viewing - one UPDATE however many are unread
+    if Notification.mark_read(current_user.id):
+        mark_changed(current_user.id)
     db.session.commit()
 
     return render_template('main/notifications.html',
@@ -41,23 +42,47 @@ def notifications():
                            user=current_user)
 
 
+def count_unread_notifications(user_id):
+    return User.get_unread_count(user_id)
+
+
 @main_bp.route('/notifications/count')
 @login_required
 def notifications_count():
     """Get unread notifications count (for AJAX)"""
-    count = Notification.query.filter_by(
-        user_id=current_user.id,
-        is_read=False
-    ).count()
+    return jsonify({'count': count_unread_notifications(current_user.id)})
 
-    return jsonify({'count': count})
+
+@main_bp.route('/notifications/stream')
+@login_required
+def notifications_stream():
+    """Push the unread count and dropdown preview whenever they change (SSE)"""
+    config = current_app.config
+    user_id = current_user.id
+    poller.start(current_app._get_current_object(), config['NOTIFICATION_STREAM_POLL'])
+    subscription = broker.subscribe(user_id, limit=config['NOTIFICATION_STREAM_MAX'])
+    if subscription is None:
+        return Response('Too many open notification streams', status=503, mimetype='text/plain',
+                        headers={'Retry-After': str(config['NOTIFICATION_STREAM_LIFETIME'])})
+
+    stream = event_stream(user_id, subscription, notifications_snapshot,
+                          keepalive=config['NOTIFICATION_STREAM_KEEPALIVE'],
+                          resync=config['NOTIFICATION_STREAM_RESYNC'],
+                          lifetime=config['NOTIFICATION_STREAM_LIFETIME'])
+
+    response = Response(stream_with_context(stream), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The generator's own cleanup never runs if the client leaves before the first message
+    response.call_on_close(lambda: broker.unsubscribe(user_id, subscription))
+    return response
 
 
 @main_bp.route('/notifications/clear', methods=['POST'])
 @login_required
 def clear_notifications():
     """Clear all notifications"""
-    Notification.query.filter_by(user_id=current_user.id).delete()
+    Notification.clear(current_user.id)
+    mark_changed(current_user.id)
     db.session.commit()
 
     return jsonify({'success': True})
@@ -73,39 +98,53 @@ def mark_notification_read(notification_id):
     if notification.user_id != current_user.id:
         return jsonify({'success': False, 'error': 'Not authorized'}), 403
 
-    notification.is_read = True
+    if Notification.mark_read(current_user.id, notification.id):
+        mark_changed(current_user.id)
     db.session.commit()
 
     return jsonify({'success': True})
 
 
+def compute_home_stats():
+    """Sidebar figures for the home page (cached under HOME_STATS)"""
+    from app.models import Event
+
+    upcoming_events = Event.query.filter_by(status='approved', phase='upcoming') \
+        .order_by(Event.start_date.asc()) \
+        .limit(5).all()
+
+    return {
+        'post_count': Post.query.count(),
+        'user_count': User.query.count(),
+        'event_count': Event.query.filter_by(status='approved').count(),
+        'comment_count': Comment.query.count(),
+        'upcoming_events': [{
+            'id': event.id,
+            'title': event.title,
+            'venue': event.venue,
+            'status': event.status,
+            'start_date': event.start_date.isoformat()
+        } for event in upcoming_events]
+    }
+
+
 @main_bp.route('/')
 @main_bp.route('/home')
 def home():
-    from app.models import Post, User, Event, Comment
-
-    posts = Post.query.order_by(Post.created_at.desc()).limit(5).all()
+    posts = load_viewer_reactions(feed_query().limit(5).all(), current_user)
 
-    # Get stats for sidebar
-    post_count = Post.query.count()
-    user_count = User.query.count()
-    event_count = Event.query.filter_by(status='approved').count()
-    comment_count = Comment.query.count()
-
-    # Get upcoming events for sidebar
-    from datetime import datetime
-    upcoming_events = Event.query.filter_by(status='approved') \
-        .filter(Event.start_date >= datetime.utcnow()) \
-        .order_by(Event.start_date.asc()) \
-        .limit(5).all()
+    # Sidebar stats are shared by every visitor, so serve them from the cache
+    stats = get_or_compute(HOME_STATS, compute_home_stats)
+    upcoming_events = [dict(event, start_date=datetime.fromisoformat(event['start_date']))
+                       for event in stats['upcoming_events']]
 
     return render_template('main/home.html',
                            posts=posts,
                            events=upcoming_events,
-                           post_count=post_count,
-                           user_count=user_count,
-                           event_count=event_count,
-                           comment_count=comment_count,
+                           post_count=stats['post_count'],
+                           user_count=stats['user_count'],
+                           event_count=stats['event_count'],
+                           comment_count=stats['comment_count'],
                            user=current_user)
 
 
@@ -113,34 +152,80 @@ def home():
 @login_required
 def notifications_preview():
     """Get preview of recent notifications (for dropdown)"""
-    notifications = Notification.query.filter_by(user_id=current_user.id) \
+    notifications = preview_notifications(current_user.id)
+    for notification in notifications:
+        notification['time'] = time_ago(datetime.fromisoformat(notification['created_at'].rstrip('Z')))
+
+    return jsonify({'notifications': notifications})
+
+
+@main_bp.route('/notifications/summary')
+@login_required
+def notifications_summary():
+    """Unread count and latest previews in one response (for the navbar)
+
+    The ETag is the user's notification version, so a page load that finds
+    nothing new costs one primary-key lookup and an empty 304.
+    """
+    count, version = User.get_notification_state(current_user.id)
+    etag = f'{current_user.id}-{version}'
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify({'count': count, 'version': version,
+                            'notifications': preview_notifications(current_user.id)})
+
+    response.set_etag(etag)
+    return private_revalidate(response)
+
+
+def private_revalidate(response):
+    """Let only the viewer's browser keep `response`, and only after checking its ETag"""
+    # The answer depends on who is asking, so only the browser may reuse it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def time_ago(moment):
+    """'3h ago' style label, for clients that do not format times themselves"""
+    time_diff = datetime.utcnow() - moment
+    if time_diff.days > 0:
+        return f"{time_diff.days}d ago"
+    elif time_diff.seconds > 3600:
+        return f"{time_diff.seconds // 3600}h ago"
+    elif time_diff.seconds > 60:
+        return f"{time_diff.seconds // 60}m ago"
+    return "Just now"
+
+
+def preview_notifications(user_id, limit=5):
+    """The newest notifications as JSON-ready dicts for the navbar dropdown
+
+    created_at is ISO 8601 UTC; the browser turns it into "5m ago".
+    """
+    notifications = Notification.query.filter_by(user_id=user_id) \
         .order_by(Notification.created_at.desc()) \
-        .limit(5) \
+        .limit(limit) \
         .all()
 
-    notifications_data = []
-    for notification in notifications:
-        # Calculate time ago
-        time_diff = datetime.utcnow() - notification.created_at
-        if time_diff.days > 0:
-            time_ago = f"{time_diff.days}d ago"
-        elif time_diff.seconds > 3600:
-            time_ago = f"{time_diff.seconds // 3600}h ago"
-        elif time_diff.seconds > 60:
-            time_ago = f"{time_diff.seconds // 60}m ago"
-        else:
-            time_ago = "Just now"
-
-        notifications_data.append({
-            'id': notification.id,
-            'title': notification.title,
-            'message': notification.message,
-            'type': notification.notification_type,
-            'is_read': notification.is_read,
-            'time': time_ago
-        })
+    return [{
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'type': notification.notification_type,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat() + 'Z'
+    } for notification in notifications]
+
 
-    return jsonify({'notifications': notifications_data})
+def notifications_snapshot(user_id):
+    """What the notifications stream sends - the same shape as /notifications/summary"""
+    count, version = User.get_notification_state(user_id)
+    return {'count': count, 'version': version,
+            'notifications': preview_notifications(user_id)}
 
 
 @main_bp.route('/create-post', methods=['GET', 'POST'])
@@ -166,6 +251,7 @@ def create_post():
             )
 
             db.session.add(post)
+            invalidate(HOME_STATS, FORUM_CATEGORIES)
             db.session.commit()
 
             flash('Post created successfully!', 'success')
@@ -191,7 +277,9 @@ def delete_post(post_id):
     if post.user_id != current_user.id and not current_user.is_admin():
         return jsonify({'success': False, 'error': 'Not authorized'}), 403
 
+    # Comments and reactions go with the post (cascade), and its counters with its row
     db.session.delete(post)
+    invalidate(HOME_STATS, FORUM_CATEGORIES)
     db.session.commit()
 
     flash('Post deleted successfully!', 'success')
@@ -207,96 +295,56 @@ def react_to_post(post_id, reaction_type):
         if not current_user.is_authenticated:
             return jsonify({'success': False, 'error': 'Not authenticated'}), 401
 
-        post = Post.query.get_or_404(post_id)
-        user_id = current_user.id
-
         # Valid medical reactions
-        valid_reactions = ['stethoscope', 'heartbeat', 'pill', 'syringe', 'tooth', 'dna', 'remove']
+        valid_reactions = list(REACTION_TYPES) + ['remove']
 
         if reaction_type not in valid_reactions:
             return jsonify({'success': False, 'error': 'Invalid reaction type'}), 400
 
-        # Check if user already reacted to this post
-        existing_reaction = PostReaction.query.filter_by(
-            post_id=post_id,
-            user_id=user_id
-        ).first()
-
-        if reaction_type == 'remove':
-            # Remove reaction if exists
-            if existing_reaction:
-                db.session.delete(existing_reaction)
-                db.session.commit()
-
-                # Get updated reaction counts
-                reaction_counts = post.get_reaction_counts()
-
-                return jsonify({
-                    'success': True,
-                    'action': 'removed',
-                    'reaction_counts': reaction_counts,
-                    'user_reaction': None
-                })
-            else:
-                return jsonify({'success': False, 'error': 'No reaction to remove'}), 400
-        else:
-            # Add or update reaction
-            if existing_reaction:
-                # Update existing reaction
-                if existing_reaction.reaction_type == reaction_type:
-                    # Same reaction clicked again - remove it
-                    db.session.delete(existing_reaction)
-                    action = 'removed'
-                    user_reaction = None
-                else:
-                    # Different reaction - update it
-                    existing_reaction.reaction_type = reaction_type
-                    action = 'updated'
-                    user_reaction = reaction_type
-            else:
-                # Create new reaction
-                new_reaction = PostReaction(
-                    user_id=user_id,
-                    post_id=post_id,
-                    reaction_type=reaction_type
-                )
-                db.session.add(new_reaction)
-                action = 'added'
-                user_reaction = reaction_type
+        # Reaction write, counters and notification all go in one transaction
+        result = PostReaction.toggle(post_id, current_user.id, reaction_type)
+
+        if result is None:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Post not found'}), 404
+
+        if result['action'] is None:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'No reaction to remove'}), 400
+
+        # CREATE NOTIFICATION for post owner (if not reacting to own post)
+        if result['user_reaction'] and result['post_user_id'] != current_user.id:
+            reaction_names = {
+                'stethoscope': 'stethoscope',
+                'heartbeat': 'heartbeat',
+                'pill': 'pill',
+                'syringe': 'syringe',
+                'tooth': 'tooth',
+                'dna': 'DNA'
+            }
+
+            post_title = (result['post_title'] or '')[:50]
+            # Delivered by the notification worker; one per reactor, reaction and hour
+            NotificationOutbox.enqueue(
+                idempotency_key=f'post_reaction:{post_id}:{current_user.id}:{reaction_type}:'
+                                f'{datetime.utcnow():%Y%m%d%H}',
+                user_id=result['post_user_id'],
+                actor=current_user,
+                title='New Reaction',
+                message=f'{current_user.username} reacted with {reaction_names.get(reaction_type, reaction_type)} to your post "{post_title}..."',
+                summary=f'reacted to your post "{post_title}..."',
+                notification_type='post_reaction',
+                related_id=post_id
+            )
 
-            db.session.commit()
+        db.session.commit()
 
-            # CREATE NOTIFICATION for post owner (if not reacting to own post)
-            if post.user_id != current_user.id:
-                reaction_names = {
-                    'stethoscope': 'stethoscope',
-                    'heartbeat': 'heartbeat',
-                    'pill': 'pill',
-                    'syringe': 'syringe',
-                    'tooth': 'tooth',
-                    'dna': 'DNA'
-                }
-
-                # Use direct creation instead of static method to avoid issues
-                notification = Notification(
-                    user_id=post.user_id,
-                    title='New Reaction',
-                    message=f'{current_user.username} reacted with {reaction_names.get(reaction_type, reaction_type)} to your post "{post.title[:50]}..."',
-                    notification_type='post_reaction',
-                    related_id=post_id
-                )
-                db.session.add(notification)
-                db.session.commit()
-
-            # Get updated reaction counts
-            reaction_counts = post.get_reaction_counts()
-
-            return jsonify({
-                'success': True,
-                'action': action,
-                'reaction_counts': reaction_counts,
-                'user_reaction': user_reaction
-            })
+        return jsonify({
+            'success': True,
+            'action': result['action'],
+            'reaction_counts': result['reaction_counts'],
+            'user_reaction': result['user_reaction']
+        })
 
     except Exception as e:
         db.session.rollback()
@@ -327,6 +375,44 @@ def get_post_reactions(post_id):
     })
 
 
+@main_bp.route('/posts/reactions')
+def get_posts_reactions():
+    """Reaction counts and the viewer's reaction for many posts (for AJAX)
+
+    /posts/reactions?ids=1,2,3 answers with two queries however many posts
+    are asked for, and sends an ETag so an unchanged refresh is a bodyless 304.
+    """
+    try:
+        post_ids = list(dict.fromkeys(int(post_id) for post_id in request.args.get('ids', '').split(',')
+                                      if post_id.strip()))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'ids must be a comma-separated list of post ids'}), 400
+
+    limit = current_app.config['REACTIONS_BATCH_LIMIT']
+    if not post_ids:
+        return jsonify({'success': False, 'error': 'No post ids given'}), 400
+    if len(post_ids) > limit:
+        return jsonify({'success': False, 'error': f'At most {limit} posts per request'}), 400
+
+    counter_columns = [getattr(Post, f'{reaction_type}_count') for reaction_type in REACTION_TYPES]
+    rows = Post.query.with_entities(Post.id, *counter_columns).filter(Post.id.in_(post_ids)).all()
+    user_reactions = viewer_reactions(post_ids, current_user)
+
+    posts = {}
+    for row in rows:
+        reaction_counts = {reaction_type: count for reaction_type, count in zip(REACTION_TYPES, row[1:]) if count}
+        posts[str(row.id)] = {
+            'reaction_counts': reaction_counts,
+            'user_reaction': user_reactions.get(row.id),
+            'total_reactions': sum(reaction_counts.values())
+        }
+
+    payload = {'success': True, 'posts': posts}
+    response = jsonify(payload)
+    response.set_etag(hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest())
+    return private_revalidate(response).make_conditional(request)
+
+
 @main_bp.route('/post/<int:post_id>/comment', methods=['POST'])
 @login_required
 def add_comment(post_id):
@@ -344,6 +430,22 @@ def add_comment(post_id):
     )
 
     db.session.add(comment)
+    db.session.flush()
+    post.adjust_comment_count(1)
+
+    if post.user_id != current_user.id:
+        NotificationOutbox.enqueue(
+            idempotency_key=f'comment:{comment.id}',
+            user_id=post.user_id,
+            actor=current_user,
+            title='New Comment',
+            message=f'{current_user.username} commented on your post "{post.title[:50]}..."',
+            summary=f'commented on your post "{post.title[:50]}..."',
+            notification_type='comment',
+            related_id=post.id
+        )
+
+    invalidate(HOME_STATS)
     db.session.commit()
 
     # Get the comment with author info
@@ -370,7 +472,9 @@ def delete_comment(comment_id):
     if comment.user_id != current_user.id and comment.post.user_id != current_user.id and not current_user.is_admin():
         return jsonify({'success': False, 'error': 'Not authorized'}), 403
 
+    comment.post.adjust_comment_count(-1)
     db.session.delete(comment)
+    invalidate(HOME_STATS)
     db.session.commit()
 
     return jsonify({'success': True})
@@ -378,11 +482,10 @@ def delete_comment(comment_id):
 
 @main_bp.route('/news')
 def news():
-    page = request.args.get('page', 1, type=int)
     per_page = 10
 
-    posts = Post.query.order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
+    posts = paginate(feed_query(), Post.created_at, Post.id, per_page)
+    load_viewer_reactions(posts, current_user)
 
     return render_template('main/news.html',
                            posts=posts,
@@ -392,7 +495,8 @@ def news():
 @main_bp.route('/profile')
 @login_required
 def profile():
-    user_posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).all()
+    user_posts = load_viewer_reactions(
+        feed_query().filter(Post.user_id == current_user.id).all(), current_user)
 
     return render_template('main/profile.html',
                            user=current_user,
@@ -402,36 +506,10 @@ def profile():
 @main_bp.route('/profile/<username>')
 def view_profile(username):
     user = User.query.filter_by(username=username).first_or_404()
-    user_posts = Post.query.filter_by(user_id=user.id).order_by(Post.created_at.desc()).limit(10).all()
+    user_posts = load_viewer_reactions(
+        feed_query().filter(Post.user_id == user.id).limit(10).all(), current_user)
 
     return render_template('main/view_profile.html',
                            profile_user=user,
                            posts=user_posts,
                            user=current_user)
-@app.route('/reset-db')
-def reset_database():
-    '''TEMPORARY ROUTE - Remove after use!'''
-    from app import db
-    from app.models import User
-    
-    try:
-        # Drop all tables
-        db.drop_all()
-        
-        # Recreate tables
-        db.create_all()
-        
-        # Create admin user
-        admin = User(
-            username='admin',
-            email='admin@kuhes.edu',
-            role='admin'
-        )
-        admin.set_password('admin123')
-        db.session.add(admin)
-        db.session.commit()
-        
-        return '? Database reset successfully! Admin created: admin@kuhes.edu / admin123'
-    except Exception as e:
-        return f'? Error: {str(e)}'
-
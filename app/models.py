@@ -1,9 +1,10 @@
 # app/models.py - FIXED TOP SECTION
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
 
+from app.passwords import hasher
+
 # Create db instance HERE instead of importing from app
 db = SQLAlchemy()
 
@@ -13,6 +14,9 @@ from app import db
 
 # ... rest of your models code ...
 
+# Medical reactions a user can leave on a post (one per user per post)
+REACTION_TYPES = ('stethoscope', 'heartbeat', 'pill', 'syringe', 'tooth', 'dna')
+
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -20,7 +24,7 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(255))  # scrypt hashes run to ~162 characters
     first_name = db.Column(db.String(64))
     last_name = db.Column(db.String(64))
     faculty = db.Column(db.String(100))
@@ -30,6 +34,13 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Kept in step with notifications.is_read so the badge never counts rows
+    unread_notification_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Goes up on every change to the user's notifications; the summary ETag
+    notification_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Part of the login id; bumping it signs the user out everywhere, remember-me cookies included
+    session_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Relationships
     posts = db.relationship('Post', backref='author', lazy=True, cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='author', lazy=True, cascade='all, delete-orphan')
@@ -42,11 +53,17 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+    def get_id(self):
+        return f'{self.id}:{self.session_version or 0}'
+
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return hasher.needs_rehash(self.password_hash)
 
     def get_full_name(self):
         return f"{self.first_name} {self.last_name}"
@@ -61,6 +78,41 @@ class User(UserMixin, db.Model):
         self.last_seen = datetime.utcnow()
         db.session.add(self)
 
+    @staticmethod
+    def adjust_unread_count(user_id, delta=0):
+        """Change a user's unread counter by `delta` and bump their notification version (no commit)
+
+        Call with delta=0 for changes that leave the unread count alone, such
+        as a coalesced notification being updated.
+        """
+        User.query.filter_by(id=user_id).update({
+            User.unread_notification_count: User.unread_notification_count + delta,
+            User.notification_version: User.notification_version + 1
+        })
+
+    @staticmethod
+    def get_unread_count(user_id):
+        """Unread notification count by primary key - no scan of notifications"""
+        return db.session.query(User.unread_notification_count).filter_by(id=user_id).scalar() or 0
+
+    @staticmethod
+    def get_notification_state(user_id):
+        """(unread count, notification version) for a user, by primary key"""
+        return tuple(db.session.query(User.unread_notification_count, User.notification_version)
+                     .filter_by(id=user_id).one())
+
+    @staticmethod
+    def rebuild_unread_counts():
+        """Recompute every user's unread notification counter in one UPDATE"""
+        result = db.session.execute(db.update(User).values({
+            User.unread_notification_count: db.select(db.func.count(Notification.id))
+                .where(Notification.user_id == User.id, Notification.is_read == False)
+                .scalar_subquery(),
+            User.notification_version: User.notification_version + 1
+        }))
+        db.session.commit()
+        return result.rowcount
+
 
 class Post(db.Model):
     __tablename__ = 'posts'
@@ -73,26 +125,77 @@ class Post(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
+    # Denormalized counters, kept in step with comments/post_reactions by
+    # adjust_comment_count() and PostReaction.toggle(), rebuilt by rebuild_counters()
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    stethoscope_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    heartbeat_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    pill_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    syringe_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    tooth_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    dna_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Relationships
     comments = db.relationship('Comment', backref='post', lazy=True, cascade='all, delete-orphan')
     reactions = db.relationship('PostReaction', backref='post', lazy=True, cascade='all, delete-orphan')
 
+    # Newest-first feeds seek on (created_at, id); see app.pagination
+    __table_args__ = (
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_posts_category_created_at_id', 'category', 'created_at', 'id'),
+    )
+
+    # The current user's reaction, filled in per request by app.feed.load_viewer_reactions()
+    viewer_reaction = None
+
+    # Highlighted title/excerpt (Markup), filled in by app.search.search_posts()
+    search_title = None
+    search_snippet = None
+
     def __repr__(self):
         return f'<Post {self.id} - {self.title[:20]}>'
 
     def get_reaction_counts(self):
-        from collections import defaultdict
-        counts = defaultdict(int)
-        for reaction in self.reactions:
-            counts[reaction.reaction_type] += 1
-        return dict(counts)
+        counts = {}
+        for reaction_type in REACTION_TYPES:
+            count = getattr(self, f'{reaction_type}_count') or 0
+            if count > 0:
+                counts[reaction_type] = count
+        return counts
+
+    def get_reactions_count(self):
+        return sum(self.get_reaction_counts().values())
+
+    def adjust_comment_count(self, delta):
+        """Bump the comment counter in the current transaction (no commit)"""
+        # Setting updated_at to itself stops its onupdate hook treating this as an edit
+        Post.query.filter_by(id=self.id).update({Post.comment_count: Post.comment_count + delta,
+                                                 Post.updated_at: Post.updated_at})
 
     def get_user_reaction(self, user_id):
         reaction = PostReaction.query.filter_by(post_id=self.id, user_id=user_id).first()
         return reaction.reaction_type if reaction else None
 
     def get_comments_count(self):
-        return len(self.comments)
+        return self.comment_count or 0
+
+    @staticmethod
+    def rebuild_counters():
+        """Recompute every post's counters from comments/post_reactions in one UPDATE"""
+        values = {
+            Post.comment_count: db.select(db.func.count(Comment.id))
+                .where(Comment.post_id == Post.id)
+                .scalar_subquery()
+        }
+        for reaction_type in REACTION_TYPES:
+            values[getattr(Post, f'{reaction_type}_count')] = db.select(db.func.count(PostReaction.id)) \
+                .where(PostReaction.post_id == Post.id, PostReaction.reaction_type == reaction_type) \
+                .scalar_subquery()
+
+        values[Post.updated_at] = Post.updated_at
+        result = db.session.execute(db.update(Post).values(values))
+        db.session.commit()
+        return result.rowcount
 
 
 class Comment(db.Model):
@@ -130,22 +233,72 @@ class Event(db.Model):
     rejection_reason = db.Column(db.Text)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
+    # Booking index, kept up to date by app.conflicts on every save
+    venue_key = db.Column(db.String(200))  # normalized venue name
+    duration_minutes = db.Column(db.Integer)
+
+    # Lifecycle, kept current by app.lifecycle (on save, then by `flask sweep-event-phases`)
+    phase = db.Column(db.String(10), default='upcoming')  # upcoming, ongoing or past
+    phase_changes_at = db.Column(db.DateTime)  # when the phase next changes (None once past)
+
+    __table_args__ = (
+        db.Index('ix_events_status_start_date', 'status', 'start_date'),
+        db.Index('ix_events_status_created_at', 'status', 'created_at'),
+        db.Index('ix_events_venue_key_start_date', 'venue_key', 'start_date'),
+        db.Index('ix_events_venue_key_duration', 'venue_key', 'duration_minutes'),
+        db.Index('ix_events_status_duration', 'status', 'duration_minutes'),
+        db.Index('ix_events_status_phase_start_date', 'status', 'phase', 'start_date'),
+        db.Index('ix_events_phase_changes_at', 'phase_changes_at'),
+    )
+
     def __repr__(self):
         return f'<Event {self.title}>'
 
     def is_upcoming(self):
-        return self.start_date > datetime.utcnow()
+        return self.phase == 'upcoming'
 
     def is_ongoing(self):
-        now = datetime.utcnow()
-        if self.end_date:
-            return self.start_date <= now <= self.end_date
-        return self.start_date.date() == now.date()
+        return self.phase == 'ongoing'
 
     def is_past(self):
-        if self.end_date:
-            return self.end_date < datetime.utcnow()
-        return self.start_date < datetime.utcnow()
+        return self.phase == 'past'
+
+    @staticmethod
+    def update_many(values):
+        """Write derived columns onto many events in one executemany UPDATE (no commit).
+
+        `values` holds one dict per event: its 'id' plus the same columns to
+        set for every event. updated_at is left alone - nobody edited them.
+        """
+        if not values:
+            return
+        table = Event.__table__
+        columns = [column for column in values[0] if column != 'id']
+        # Bind names must differ from the column names in an executemany UPDATE
+        statement = db.update(table).where(table.c.id == db.bindparam('event_id')).values(
+            {**{column: db.bindparam(f'new_{column}') for column in columns},
+             'updated_at': table.c.updated_at}
+        )
+        db.session.execute(statement, [
+            {'event_id': row['id'], **{f'new_{column}': row[column] for column in columns}}
+            for row in values
+        ])
+
+    @staticmethod
+    def backfill(columns, compute, batch_size=500):
+        """Store compute(row) on every event, reading `columns` for `batch_size` events at a time.
+
+        Walks the events in id order and commits each batch (see update_many).
+        """
+        last_id = 0
+        while True:
+            rows = db.session.query(Event.id, *columns) \
+                .filter(Event.id > last_id).order_by(Event.id).limit(batch_size).all()
+            if not rows:
+                return
+            Event.update_many([{'id': row.id, **compute(row)} for row in rows])
+            db.session.commit()
+            last_id = rows[-1].id
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -159,16 +312,59 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Coalesced notifications: how many different people acted (see notification_actors), and who acted last
+    actor_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    last_actor_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+
     # Relationship
-    user = db.relationship('User', backref='notifications', lazy=True)
+    user = db.relationship('User', backref='notifications', lazy=True, foreign_keys=[user_id])
+
+    __table_args__ = (
+        db.Index('ix_notifications_user_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_notifications_user_type_related', 'user_id', 'notification_type', 'related_id'),
+        db.Index('ix_notifications_user_is_read_created_at', 'user_id', 'is_read', 'created_at'),
+    )
+
+    # Actors of a notification that has no id yet, written by save_pending_actors()
+    pending_actors = None
 
     def __repr__(self):
         return f'<Notification {self.id} for user {self.user_id}>'
 
     def mark_as_read(self):
-        self.is_read = True
+        Notification.mark_read(self.user_id, self.id)
         db.session.commit()
 
+    @staticmethod
+    def mark_read(user_id, notification_id=None):
+        """Mark one, or all, of a user's unread notifications read in a single UPDATE.
+
+        The user's unread counter drops by the rows actually changed, so
+        marking an already-read notification is a no-op. Does not commit.
+        Returns the number of notifications marked.
+        """
+        query = Notification.query.filter_by(user_id=user_id, is_read=False)
+        if notification_id is not None:
+            query = query.filter_by(id=notification_id)
+
+        marked = query.update({Notification.is_read: True})
+        if marked:
+            User.adjust_unread_count(user_id, -marked)
+        return marked
+
+    @staticmethod
+    def clear(user_id):
+        """Delete all of a user's notifications and zero their unread counter (no commit)"""
+        NotificationActor.query.filter(NotificationActor.notification_id.in_(
+            db.select(Notification.id).where(Notification.user_id == user_id)
+        )).delete(synchronize_session=False)
+        deleted = Notification.query.filter_by(user_id=user_id).delete()
+        User.query.filter_by(id=user_id).update({
+            User.unread_notification_count: 0,
+            User.notification_version: User.notification_version + 1
+        })
+        return deleted
+
     @staticmethod
     def create_notification(user_id, title, message, notification_type=None, related_id=None):
         notification = Notification(
@@ -179,8 +375,154 @@ class Notification(db.Model):
             related_id=related_id
         )
         db.session.add(notification)
+        User.adjust_unread_count(user_id, 1)
         db.session.commit()
         return notification
+
+    def absorb(self, actor_id, actor_name, message, summary=None, at=None):
+        """Fold another occurrence of the same event into this notification.
+
+        The actor count goes up only for someone who has not acted on it
+        before, the latest actor is recorded and the notification moves to the
+        top of the list. `message` is used while there is a single actor;
+        `summary` finishes "Alice and 41 others ...". Does not commit.
+        """
+        if self.add_actor(actor_id):
+            self.actor_count = (self.actor_count or 1) + 1
+        self.last_actor_id = actor_id
+        self.created_at = at or datetime.utcnow()
+
+        others = self.actor_count - 1
+        if others and summary:
+            self.message = f'{actor_name} and {others} other{"s" if others != 1 else ""} {summary}'
+        else:
+            self.message = message
+
+    def add_actor(self, actor_id):
+        """Record that actor_id acted on this notification; True if they had not before (no commit).
+
+        Saved notifications insert into notification_actors with ON CONFLICT
+        DO NOTHING, so the answer comes from the primary key. Notifications
+        not yet flushed collect their actors in pending_actors instead.
+        """
+        if actor_id is None:
+            return False
+        if self.id is None:
+            if self.pending_actors is None:
+                self.pending_actors = set()
+            if actor_id in self.pending_actors:
+                return False
+            self.pending_actors.add(actor_id)
+            return True
+
+        statement = dialect_insert(NotificationActor.__table__).values(
+            notification_id=self.id, user_id=actor_id
+        ).on_conflict_do_nothing(index_elements=['notification_id', 'user_id'])
+        return db.session.execute(statement).rowcount == 1
+
+    @staticmethod
+    def save_pending_actors(notifications):
+        """Write the pending_actors of freshly flushed notifications in one INSERT (no commit)"""
+        rows = [{'notification_id': notification.id, 'user_id': actor_id}
+                for notification in notifications for actor_id in (notification.pending_actors or ())]
+        if rows:
+            db.session.execute(db.insert(NotificationActor), rows)
+        for notification in notifications:
+            notification.pending_actors = None
+
+    @staticmethod
+    def rebuild_actors():
+        """Seed notification_actors from last_actor_id for notifications saved before it existed"""
+        statement = dialect_insert(NotificationActor.__table__).from_select(
+            ['notification_id', 'user_id'],
+            db.select(Notification.id, Notification.last_actor_id).where(Notification.last_actor_id.isnot(None))
+        ).on_conflict_do_nothing(index_elements=['notification_id', 'user_id'])
+        result = db.session.execute(statement)
+        db.session.commit()
+        return result.rowcount
+
+
+class NotificationActor(db.Model):
+    """One person who acted on a coalesced notification (see Notification.add_actor)"""
+    __tablename__ = 'notification_actors'
+
+    notification_id = db.Column(db.Integer, db.ForeignKey('notifications.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+
+    def __repr__(self):
+        return f'<NotificationActor user {self.user_id} on notification {self.notification_id}>'
+
+
+def dialect_insert(table):
+    """INSERT for `table` with the database's ON CONFLICT support"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+class NotificationOutbox(db.Model):
+    """A notification waiting for the worker (flask notification-worker).
+
+    Rows are written in the same transaction as the action that causes them,
+    so a rolled-back request never notifies and a committed one always will,
+    without the request paying for the fan-out.
+    """
+    __tablename__ = 'notification_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    actor_name = db.Column(db.String(64))
+    notification_type = db.Column(db.String(50))
+    related_id = db.Column(db.Integer)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    summary = db.Column(db.Text)  # "... reacted to your post" once several people acted
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Delivery bookkeeping for the worker
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_notification_outbox_pending', 'processed_at', 'available_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<NotificationOutbox {self.idempotency_key}>'
+
+    @staticmethod
+    def enqueue(idempotency_key, user_id, title, message, notification_type=None, related_id=None,
+                actor=None, summary=None):
+        """Queue a notification in the current transaction (no commit).
+
+        A second enqueue with an idempotency_key that is already queued is
+        ignored, so double submits and retried requests notify once.
+        Returns True if the notification was queued.
+        """
+        now = datetime.utcnow()
+        statement = dialect_insert(NotificationOutbox.__table__).values(
+            idempotency_key=idempotency_key,
+            user_id=user_id,
+            actor_id=actor.id if actor else None,
+            actor_name=actor.username if actor else None,
+            notification_type=notification_type,
+            related_id=related_id,
+            title=title,
+            message=message,
+            summary=summary,
+            created_at=now,
+            attempts=0,
+            available_at=now
+        ).on_conflict_do_nothing(index_elements=['idempotency_key'])
+        return db.session.execute(statement).rowcount == 1
+
+
 class PostReaction(db.Model):
     __tablename__ = 'post_reactions'
 
@@ -196,4 +538,100 @@ class PostReaction(db.Model):
     __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='unique_user_post_reaction'),)
 
     def __repr__(self):
-        return f'<Reaction {self.reaction_type} by user {self.user_id} on post {self.post_id}>'
\ No newline at end of file
+        return f'<Reaction {self.reaction_type} by user {self.user_id} on post {self.post_id}>'
+
+    @staticmethod
+    def toggle(post_id, user_id, reaction_type):
+        """Apply a reaction click in the current transaction (no commit).
+
+        Clicking the reaction you already have removes it, a different one
+        replaces it, and 'remove' clears it. The first statement is a write so
+        SQLite takes the write lock up front instead of upgrading mid-request:
+
+          1. DELETE ... RETURNING reaction_type   - the previous reaction, if any
+          2. INSERT                               - the new reaction, if any
+          3. UPDATE posts ... RETURNING           - both counters in one statement,
+                                                    handing back the fresh totals
+
+        The DELETE has already cleared the (user_id, post_id) row, so the
+        INSERT needs no ON CONFLICT clause. If a concurrent click inserts it
+        in between, the unique constraint fails this transaction rather than
+        overwriting a reaction whose counter was already bumped.
+
+        Returns None if the post does not exist (roll back), otherwise a dict
+        with action ('added', 'updated', 'removed', or None when 'remove' found
+        nothing), previous, user_reaction, reaction_counts and the post's
+        user_id/title for notifications.
+        """
+        previous = db.session.execute(
+            db.delete(PostReaction)
+            .where(PostReaction.user_id == user_id, PostReaction.post_id == post_id)
+            .returning(PostReaction.reaction_type)
+        ).scalar()
+
+        if reaction_type == 'remove' or reaction_type == previous:
+            new_reaction = None
+            action = 'removed' if previous else None
+        else:
+            new_reaction = reaction_type
+            action = 'updated' if previous else 'added'
+
+        if new_reaction:
+            db.session.execute(db.insert(PostReaction).values(
+                user_id=user_id, post_id=post_id,
+                reaction_type=new_reaction, created_at=datetime.utcnow()
+            ))
+
+        counters = {Post.updated_at: Post.updated_at}
+        if previous:
+            column = getattr(Post, f'{previous}_count')
+            counters[column] = column - 1
+        if new_reaction:
+            column = getattr(Post, f'{new_reaction}_count')
+            counters[column] = column + 1
+
+        counter_columns = [getattr(Post, f'{name}_count') for name in REACTION_TYPES]
+        row = db.session.execute(
+            db.update(Post).where(Post.id == post_id).values(counters)
+            .returning(Post.user_id, Post.title, *counter_columns)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is None:
+            return None
+
+        return {
+            'action': action,
+            'previous': previous,
+            'user_reaction': new_reaction,
+            'reaction_counts': {name: row[2 + index] for index, name in enumerate(REACTION_TYPES)
+                                if row[2 + index] > 0},
+            'post_user_id': row.user_id,
+            'post_title': row.title
+        }
+
+
+class CacheEntry(db.Model):
+    """Shared cache row for expensive aggregates (see app/cache.py)"""
+    __tablename__ = 'cache_entries'
+
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    refreshing_until = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<CacheEntry {self.key}>'
+
+
+class ServerSession(db.Model):
+    """Server-side session data; the cookie only carries the id (see app/sessions.py)"""
+    __tablename__ = 'sessions'
+
+    id = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, index=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ServerSession for user {self.user_id}>'
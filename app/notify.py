@@ -0,0 +1,192 @@
+# app/notify.py - push notification changes to open pages (Server-Sent Events)
+import json
+import queue
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Notification, User
+
+
+class LocalBroker:
+    """In-process publish/subscribe keyed by user id.
+
+    Every open stream holds a one-slot queue and publish() drops a wake-up
+    into each queue for that user, so a burst of changes costs one refresh.
+    Only streams served by the same process are woken; changes made by other
+    processes reach them through VersionPoller. Run gunicorn with an async
+    (gevent) worker so an idle stream costs a greenlet rather than a thread;
+    subscribe() still takes a limit so one process cannot be swamped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id, limit=None):
+        """A wake-up queue for user_id, or None if `limit` streams are already open"""
+        subscription = queue.Queue(maxsize=1)
+        with self._lock:
+            if limit is not None and sum(len(subscribers) for subscribers in self._subscribers.values()) >= limit:
+                return None
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(True)
+            except queue.Full:
+                pass  # a wake-up is already waiting
+
+    def subscribed_users(self):
+        with self._lock:
+            return set(self._subscribers)
+
+    def subscriber_count(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class VersionPoller:
+    """One background thread per process that wakes streams for other processes' changes.
+
+    Every few seconds it reads notification_version for all users with an
+    open stream in this process - one query however many streams are open -
+    and publishes to every user whose version has moved past the one their
+    streams last sent (see seen()).
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._thread = None
+
+    def start(self, app, interval):
+        """Start polling every `interval` seconds, unless this process already is"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, args=(app, interval),
+                                            name='notification-poller', daemon=True)
+            self._thread.start()
+
+    def seen(self, user_id, version):
+        """Note that user_id's streams have sent `version`, so it is not published again"""
+        with self._lock:
+            if version > self._versions.get(user_id, -1):
+                self._versions[user_id] = version
+
+    def poll(self):
+        """Publish to every subscribed user whose version changed; returns their ids"""
+        user_ids = self.broker.subscribed_users()
+        rows = db.session.execute(db.select(User.id, User.notification_version)
+                                  .where(User.id.in_(user_ids))).all() if user_ids else []
+
+        changed = []
+        with self._lock:
+            versions = {user_id: version for user_id, version in self._versions.items() if user_id in user_ids}
+            for user_id, version in rows:
+                known = versions.get(user_id)
+                if known is not None and version > known:
+                    changed.append(user_id)
+                if known is None or version > known:
+                    versions[user_id] = version
+            self._versions = versions
+
+        for user_id in changed:
+            self.broker.publish(user_id)
+        return changed
+
+    def _run(self, app, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    self.poll()
+            except Exception:
+                app.logger.exception('Polling notification versions failed')
+
+
+broker = LocalBroker()
+poller = VersionPoller(broker)
+
+
+def mark_changed(user_id, session=None):
+    """Wake user_id's streams once the current transaction commits.
+
+    ORM changes to Notification rows are picked up automatically; call this
+    for bulk UPDATE/DELETE statements, which bypass the session.
+    """
+    session = session or db.session
+    session.info.setdefault('notification_users', set()).add(user_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, Notification) and instance.user_id is not None:
+            mark_changed(instance.user_id, session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_changed_users(session):
+    for user_id in session.info.pop('notification_users', ()):
+        broker.publish(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('notification_users', None)
+
+
+def event_stream(user_id, subscription, snapshot, keepalive=20, resync=300, lifetime=600):
+    """Generate SSE messages for user_id, woken through `subscription` (from broker.subscribe).
+
+    Sends `snapshot(user_id)` as a 'notifications' event on connect and after
+    every published change, a comment line every `keepalive` seconds so
+    proxies keep the connection open, and a fresh snapshot every `resync`
+    seconds. The snapshot's 'version' is reported to the poller, which wakes
+    the stream when another process (such as the notification worker) moves
+    it on. Ends after `lifetime` seconds; EventSource reconnects on its own.
+    The database session is released between snapshots so an idle stream
+    does not hold a connection. The subscription is released when the
+    stream ends.
+    """
+    try:
+        yield 'retry: 5000\n\n'
+        started = time.monotonic()
+        last_push = None
+
+        while time.monotonic() - started < lifetime:
+            now = time.monotonic()
+            if last_push is None or now - last_push >= resync:
+                payload = snapshot(user_id)
+                db.session.remove()
+                poller.seen(user_id, payload['version'])
+                last_push = now
+                yield f'event: notifications\ndata: {json.dumps(payload)}\n\n'
+
+            try:
+                subscription.get(timeout=keepalive)
+                last_push = None
+            except queue.Empty:
+                yield ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(user_id, subscription)
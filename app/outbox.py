@@ -0,0 +1,140 @@
+# app/outbox.py - deliver queued notifications (run by `flask --app run notification-worker`)
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import tuple_
+
+from app import db
+from app.models import Notification, NotificationOutbox, User
+
+MAX_ATTEMPTS = 5  # after this many failures an entry is left for inspection
+
+
+class AlreadyClaimed(Exception):
+    """Another worker delivered some of the entries first"""
+
+
+def pending_entries(batch_size):
+    """The oldest outbox entries that are due for delivery"""
+    return NotificationOutbox.query.filter(
+        NotificationOutbox.processed_at.is_(None),
+        NotificationOutbox.attempts < MAX_ATTEMPTS,
+        NotificationOutbox.available_at <= datetime.utcnow()
+    ).order_by(NotificationOutbox.id).limit(batch_size).all()
+
+
+def deliver(entries, window):
+    """Write notifications for `entries` in the current transaction (no commit).
+
+    The entries are claimed first with a conditional UPDATE, so an entry is
+    delivered exactly once even if two workers pick it up. Entries about the
+    same thing are folded into one notification - together with a matching
+    unread notification newer than `window`, if any - and the new rows go
+    in as one batched INSERT. Returns the number of notifications created.
+    """
+    now = datetime.utcnow()
+    ids = [entry.id for entry in entries]
+    claimed = NotificationOutbox.query.filter(
+        NotificationOutbox.id.in_(ids),
+        NotificationOutbox.processed_at.is_(None)
+    ).update({NotificationOutbox.processed_at: now}, synchronize_session=False)
+    if claimed != len(ids):
+        raise AlreadyClaimed()
+
+    groups = {}
+    for entry in entries:
+        groups.setdefault((entry.user_id, entry.notification_type, entry.related_id), []).append(entry)
+
+    existing = {}
+    if window:
+        unread = Notification.query.filter(
+            tuple_(Notification.user_id, Notification.notification_type, Notification.related_id).in_(list(groups)),
+            Notification.is_read == False,
+            Notification.created_at >= now - window
+        ).order_by(Notification.created_at)
+        existing = {(n.user_id, n.notification_type, n.related_id): n for n in unread}
+
+    created = []
+    for key, group in groups.items():
+        notification = existing.get(key)
+        for entry in group:
+            if notification is None:
+                notification = Notification(
+                    user_id=entry.user_id,
+                    title=entry.title,
+                    message=entry.message,
+                    notification_type=entry.notification_type,
+                    related_id=entry.related_id,
+                    actor_count=1,
+                    last_actor_id=entry.actor_id,
+                    created_at=entry.created_at
+                )
+                notification.add_actor(entry.actor_id)
+                created.append(notification)
+            else:
+                notification.absorb(entry.actor_id, entry.actor_name, entry.message,
+                                    entry.summary, at=entry.created_at)
+            if not window:
+                notification = None
+
+    db.session.add_all(created)
+    db.session.flush()  # one batched INSERT; the actors need the new ids
+    Notification.save_pending_actors(created)
+    new_unread = Counter({entry.user_id: 0 for entry in entries})
+    new_unread.update(notification.user_id for notification in created)
+    for user_id, count in new_unread.items():
+        User.adjust_unread_count(user_id, count)
+
+    return len(created)
+
+
+def process_outbox(batch_size=100, window=None):
+    """Deliver one batch of due entries; returns (delivered, failed).
+
+    If another worker claimed part of the batch first, the due entries are
+    read again, so (0, 0) always means nothing is due. If the batch fails as
+    a whole, its entries are retried one at a time so a single bad entry
+    cannot hold up the rest. A failing entry is retried with exponential
+    backoff and given up on after MAX_ATTEMPTS.
+    """
+    if window is None:
+        window = current_app.config['NOTIFICATION_COALESCE_WINDOW']
+
+    while True:
+        entries = pending_entries(batch_size)
+        if not entries:
+            return 0, 0
+
+        ids = [entry.id for entry in entries]
+        try:
+            deliver(entries, window)
+            db.session.commit()
+            return len(ids), 0
+        except AlreadyClaimed:
+            db.session.rollback()  # the claimed entries drop out of the next read
+        except Exception:
+            db.session.rollback()
+            break
+
+    delivered = failed = 0
+    for entry_id in ids:
+        entry = db.session.get(NotificationOutbox, entry_id)
+        if entry is None or entry.processed_at is not None:
+            continue
+        try:
+            deliver([entry], window)
+            db.session.commit()
+            delivered += 1
+        except AlreadyClaimed:
+            db.session.rollback()
+        except Exception as error:
+            db.session.rollback()
+            entry = db.session.get(NotificationOutbox, entry_id)
+            entry.attempts += 1
+            entry.last_error = str(error)[:1000]
+            entry.available_at = datetime.utcnow() + timedelta(seconds=2 ** entry.attempts)
+            db.session.commit()
+            failed += 1
+
+    return delivered, failed
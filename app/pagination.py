@@ -0,0 +1,124 @@
+# app/pagination.py - keyset (cursor) pagination over (created_at, id)
+import base64
+import binascii
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query.
+
+    Mirrors the parts of Flask-SQLAlchemy's Pagination the templates use
+    (items, has_next, has_prev, per_page, iteration) but never counts the
+    table, so total and pages are always None.
+    """
+
+    total = None
+    pages = None
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def encode_cursor(direction, sort_key, row_id):
+    """Opaque token for the row a page starts after ('n' = next page, 'p' = previous)"""
+    if isinstance(sort_key, datetime):
+        sort_key = sort_key.isoformat()
+    raw = f'{direction}|{sort_key!s}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, parse_key=datetime.fromisoformat):
+    """Return (direction, sort_key, id) or None if the token is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        direction, sort_key, row_id = raw.split('|')
+        if direction not in ('n', 'p'):
+            return None
+        return direction, parse_key(sort_key), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def keyset_paginate(query, created_at_column, id_column, cursor=None, per_page=10, descending=True):
+    """Fetch the page after/before `cursor`, newest first (oldest first if not `descending`).
+
+    Seeks with `(created_at, id) < cursor` on an index instead of OFFSET, so
+    page 500 costs the same as page 1. An unknown or missing cursor starts at
+    the first row. Any datetime column works as `created_at_column`.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    query = query.order_by(None)
+
+    if position is None:
+        direction = 'n'
+    else:
+        direction, created_at, row_id = position
+        # 'n' walks in listing order, 'p' walks back towards the first row
+        if (direction == 'n') == descending:
+            query = query.filter(or_(created_at_column < created_at,
+                                     and_(created_at_column == created_at, id_column < row_id)))
+        else:
+            query = query.filter(or_(created_at_column > created_at,
+                                     and_(created_at_column == created_at, id_column > row_id)))
+
+    if (direction == 'n') == descending:
+        query = query.order_by(created_at_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(created_at_column.asc(), id_column.asc())
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if direction == 'p':
+        rows.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = position is not None, has_more
+
+    next_cursor = prev_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        if has_older:
+            next_cursor = encode_cursor('n', getattr(last, created_at_column.key), last.id)
+        if has_newer:
+            prev_cursor = encode_cursor('p', getattr(first, created_at_column.key), first.id)
+
+    return KeysetPage(rows, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def paginate(query, created_at_column, id_column, per_page=10, descending=True):
+    """Paginate a newest-first (or oldest-first) listing from the request arguments.
+
+    ?cursor=... (or no arguments at all) uses keyset pagination; a bare
+    ?page=N keeps the old numbered pages working for existing links, in the
+    same order as the keyset pages.
+    """
+    cursor = request.args.get('cursor')
+    page = request.args.get('page', type=int)
+
+    if page is not None and not cursor:
+        if descending:
+            query = query.order_by(None).order_by(created_at_column.desc(), id_column.desc())
+        else:
+            query = query.order_by(None).order_by(created_at_column.asc(), id_column.asc())
+        return query.paginate(page=page, per_page=per_page, error_out=False)
+
+    return keyset_paginate(query, created_at_column, id_column, cursor, per_page, descending)
@@ -0,0 +1,119 @@
+# app/passwords.py - password hashing off the request threads, in a bounded process pool
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """Too many password hashes are already waiting; the caller should retry later"""
+
+
+def method_prefix(method):
+    """The "<method>:<params>" prefix Werkzeug writes for hashes made with `method`.
+
+    Werkzeug fills in defaults ('pbkdf2' -> 'pbkdf2:sha256:600000', 'scrypt'
+    -> 'scrypt:32768:8:1'), so fill them in the same way rather than hashing
+    a throwaway password to find out.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = args or (2 ** 15, 8, 1)
+        return f'scrypt:{int(n)}:{int(r)}:{int(p)}'
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+class PasswordHasher:
+    """Runs PBKDF2/scrypt hashing in a small process pool.
+
+    At most `max_pending` hashes may be queued or running at once; further
+    callers wait up to `wait_timeout` seconds for a slot and then get
+    HashingBusy, so a login flood queues a bounded amount of CPU work
+    instead of starving every other request. With workers=0 hashing runs
+    inline (tests, scripts). Queue-time metrics are kept in stats().
+    """
+
+    def __init__(self, method='pbkdf2:sha256:600000', workers=0, max_pending=16, wait_timeout=5):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.configure(method, workers, max_pending, wait_timeout)
+
+    def configure(self, method, workers, max_pending, wait_timeout):
+        self.shutdown()
+        self.method = method
+        self.method_prefix = method_prefix(method)
+        self.workers = workers
+        self.wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._stats = {'hashed': 0, 'failed': 0, 'rejected': 0, 'in_flight': 0,
+                       'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'hash_seconds': 0.0}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, function, *args):
+        queued_at = time.monotonic()
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HashingBusy()
+
+        started_at = time.monotonic()
+        with self._lock:
+            self._stats['in_flight'] += 1
+        outcome = 'failed'
+        try:
+            if self.workers:
+                with self._lock:
+                    if self._executor is None:
+                        # forkserver: a plain fork from this threaded worker could copy a lock another thread holds
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                             mp_context=multiprocessing.get_context('forkserver'))
+                    executor = self._executor
+                result = executor.submit(function, *args).result()
+            else:
+                result = function(*args)
+            outcome = 'hashed'
+            return result
+        finally:
+            self._slots.release()
+            finished_at = time.monotonic()
+            wait = started_at - queued_at
+            with self._lock:
+                self._stats['in_flight'] -= 1
+                self._stats[outcome] += 1
+                self._stats['wait_seconds'] += wait
+                self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], wait)
+                self._stats['hash_seconds'] += finished_at - started_at
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if `pwhash` was made with another algorithm or cost than the configured one"""
+        return bool(pwhash) and pwhash.split('$', 1)[0] != self.method_prefix
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        done = stats['hashed'] + stats['failed'] or 1
+        stats['avg_wait_seconds'] = stats['wait_seconds'] / done
+        stats['avg_hash_seconds'] = stats['hash_seconds'] / done
+        return stats
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,173 @@
+# app/retention.py - keep the notifications and outbox tables from growing without bound
+import time
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Notification, NotificationActor, NotificationOutbox, User
+
+
+def _delete_in_batches(select_ids, delete_batch, batch_size, pause):
+    """Delete rows `batch_size` at a time, committing after every batch.
+
+    `select_ids(after_id, limit)` returns the next ids to delete and
+    `delete_batch(ids)` removes them. Short transactions mean the SQLite
+    write lock is only ever held for one batch. Returns the rows deleted.
+    """
+    deleted = 0
+    after_id = 0
+    while True:
+        ids = select_ids(after_id, batch_size)
+        if not ids:
+            return deleted
+
+        deleted += delete_batch(ids)
+        db.session.commit()
+        after_id = ids[-1]
+        if pause:
+            time.sleep(pause)
+
+
+def _delete_notifications(ids):
+    """Delete notifications by id, updating the owners' unread counters (no commit)"""
+    owners = db.session.query(
+        Notification.user_id,
+        db.func.sum(db.case((Notification.is_read == False, 1), else_=0))
+    ).filter(Notification.id.in_(ids)).group_by(Notification.user_id).all()
+
+    NotificationActor.query.filter(NotificationActor.notification_id.in_(ids)).delete(synchronize_session=False)
+    deleted = Notification.query.filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+    for user_id, unread in owners:
+        User.adjust_unread_count(user_id, -(unread or 0))
+    return deleted
+
+
+def purge_read_notifications(older_than_days, batch_size=500, pause=0):
+    """Delete read notifications created more than `older_than_days` ago"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    def select_ids(after_id, limit):
+        return [row.id for row in db.session.query(Notification.id).filter(
+            Notification.id > after_id,
+            Notification.is_read == True,
+            Notification.created_at < cutoff
+        ).order_by(Notification.id).limit(limit)]
+
+    return _delete_in_batches(select_ids, _delete_notifications, batch_size, pause)
+
+
+def cap_notifications_per_user(max_per_user, batch_size=500, pause=0):
+    """Keep only each user's newest `max_per_user` notifications"""
+    over_limit = db.session.query(Notification.user_id) \
+        .group_by(Notification.user_id) \
+        .having(db.func.count(Notification.id) > max_per_user) \
+        .all()
+
+    deleted = 0
+    for (user_id,) in over_limit:
+        # The oldest row that is kept; everything older than it goes
+        boundary = None
+        if max_per_user > 0:
+            boundary = db.session.query(Notification.created_at, Notification.id) \
+                .filter(Notification.user_id == user_id) \
+                .order_by(Notification.created_at.desc(), Notification.id.desc()) \
+                .offset(max_per_user - 1).limit(1).first()
+
+        def select_ids(after_id, limit, user_id=user_id, boundary=boundary):
+            query = db.session.query(Notification.id).filter(
+                Notification.user_id == user_id,
+                Notification.id > after_id
+            )
+            if boundary is not None:
+                query = query.filter(db.or_(
+                    Notification.created_at < boundary.created_at,
+                    db.and_(Notification.created_at == boundary.created_at, Notification.id < boundary.id)
+                ))
+            return [row.id for row in query.order_by(Notification.id).limit(limit)]
+
+        deleted += _delete_in_batches(select_ids, _delete_notifications, batch_size, pause)
+
+    return deleted
+
+
+def purge_outbox(older_than_days, batch_size=500, pause=0):
+    """Delete delivered outbox entries processed more than `older_than_days` ago"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    def select_ids(after_id, limit):
+        return [row.id for row in db.session.query(NotificationOutbox.id).filter(
+            NotificationOutbox.id > after_id,
+            NotificationOutbox.processed_at < cutoff
+        ).order_by(NotificationOutbox.id).limit(limit)]
+
+    def delete_batch(ids):
+        return NotificationOutbox.query.filter(NotificationOutbox.id.in_(ids)) \
+            .delete(synchronize_session=False)
+
+    return _delete_in_batches(select_ids, delete_batch, batch_size, pause)
+
+
+def database_size():
+    """Size of the SQLite database file in bytes (None for other databases)"""
+    if db.engine.dialect.name != 'sqlite':
+        return None
+    with db.engine.connect() as connection:
+        page_count = connection.exec_driver_sql('PRAGMA page_count').scalar()
+        page_size = connection.exec_driver_sql('PRAGMA page_size').scalar()
+    return page_count * page_size
+
+
+def compact_database(mode='incremental'):
+    """Give the space freed by deletes back to the filesystem (SQLite only).
+
+    'full' runs VACUUM, which rewrites the whole file and locks the database
+    while it does. 'incremental' runs PRAGMA incremental_vacuum, which only
+    releases free pages; the first run switches the database to
+    auto_vacuum=INCREMENTAL, and that switch needs one full VACUUM.
+    Returns the file size in bytes before and after, or None if not
+    supported. The switching VACUUM can leave the file slightly larger
+    than before, so after is not always the smaller of the two.
+    """
+    before = database_size()
+    if before is None:
+        return None
+
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if mode == 'full':
+            connection.exec_driver_sql('VACUUM')
+        else:
+            if connection.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+                connection.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+                connection.exec_driver_sql('VACUUM')
+            # A plain execute frees one page per step; executescript runs it to completion
+            connection.connection.driver_connection.executescript('PRAGMA incremental_vacuum;')
+
+    return before, database_size()
+
+
+def run_retention(config, vacuum=None, pause=0):
+    """Apply the configured retention policies and report what was reclaimed.
+
+    Policies come from the app config (a value of None turns one off):
+    NOTIFICATION_RETENTION_READ_DAYS, NOTIFICATION_RETENTION_MAX_PER_USER and
+    NOTIFICATION_OUTBOX_RETENTION_DAYS, deleted NOTIFICATION_RETENTION_BATCH
+    rows at a time with `pause` seconds between batches. `vacuum` may be
+    'full' or 'incremental'; the report then has the database size before
+    and after as 'database_size'.
+    """
+    batch_size = config['NOTIFICATION_RETENTION_BATCH']
+    report = {'read_notifications': 0, 'over_user_cap': 0, 'outbox_entries': 0, 'database_size': None}
+
+    if config['NOTIFICATION_RETENTION_READ_DAYS'] is not None:
+        report['read_notifications'] = purge_read_notifications(
+            config['NOTIFICATION_RETENTION_READ_DAYS'], batch_size, pause)
+    if config['NOTIFICATION_RETENTION_MAX_PER_USER'] is not None:
+        report['over_user_cap'] = cap_notifications_per_user(
+            config['NOTIFICATION_RETENTION_MAX_PER_USER'], batch_size, pause)
+    if config['NOTIFICATION_OUTBOX_RETENTION_DAYS'] is not None:
+        report['outbox_entries'] = purge_outbox(
+            config['NOTIFICATION_OUTBOX_RETENTION_DAYS'], batch_size, pause)
+
+    if vacuum:
+        report['database_size'] = compact_database(vacuum)
+
+    return report
@@ -0,0 +1,51 @@
+# app/schema.py - bring an existing database up to the current models
+from sqlalchemy.schema import CreateColumn
+
+from app import db
+
+
+def upgrade_schema():
+    """Add columns and indexes that db.create_all() skips on existing tables.
+
+    db.create_all() only creates missing tables, so a database created by an
+    older version of the app never gets new columns or indexes. This adds them
+    in place (ALTER TABLE ... ADD COLUMN / CREATE INDEX), widens VARCHAR
+    columns the models have since made longer, and is safe to run on every
+    start-up. Returns the added columns as 'table.column' names so callers
+    can backfill them.
+    """
+    inspector = db.inspect(db.engine)
+    added = []
+
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing_columns = {column['name']: column for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}')
+                    added.append(f'{table.name}.{column.name}')
+                elif _needs_widening(existing_columns[column.name]['type'], column.type, connection.dialect):
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {column_type}')
+
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+    return added
+
+
+def _needs_widening(existing_type, model_type, dialect):
+    """True if a VARCHAR column is shorter in the database than in the model.
+
+    SQLite does not enforce VARCHAR lengths, so only PostgreSQL is altered.
+    """
+    if dialect.name != 'postgresql':
+        return False
+    existing_length = getattr(existing_type, 'length', None)
+    model_length = getattr(model_type, 'length', None)
+    return existing_length is not None and model_length is not None and existing_length < model_length
@@ -0,0 +1,161 @@
+# app/search.py - SQLite FTS5 full-text search over posts
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.feed import feed_query
+from app.models import Post
+from app.pagination import KeysetPage, encode_cursor, decode_cursor
+
+# posts_fts mirrors posts.title/content (external content table) and is kept
+# in step by triggers, so every writer - ORM or raw SQL - updates the index.
+# The update trigger only fires for title/content, not counter bumps.
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        title, content, content='posts', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF title, content ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+# Control characters FTS5 wraps around matches; swapped for <mark> after escaping
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+
+def ensure_search_index():
+    """Create the FTS5 table and triggers if missing; return True when usable.
+
+    A freshly created index is filled from the existing posts. Databases that
+    are not SQLite, or SQLite builds without FTS5, return False and search
+    falls back to LIKE matching.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+
+    try:
+        with db.engine.begin() as connection:
+            existed = connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'"
+            ).first() is not None
+            for statement in FTS_SCHEMA:
+                connection.exec_driver_sql(statement)
+            if not existed:
+                connection.exec_driver_sql("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+    except OperationalError:
+        return False
+
+    return True
+
+
+def rebuild_search_index():
+    """Re-read every post into posts_fts and return how many posts are indexed"""
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
+        connection.exec_driver_sql("INSERT INTO posts_fts(posts_fts) VALUES ('optimize')")
+    return Post.query.count()
+
+
+def build_match_query(terms):
+    """Turn free text into a safe FTS5 query: every word must match, as a prefix.
+
+    Quoting each word keeps FTS5 operators and punctuation typed by users from
+    becoming syntax errors.
+    """
+    words = re.findall(r'\w+', terms)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _highlight(fragment):
+    if not fragment:
+        return None
+    html = str(escape(fragment))
+    return Markup(html.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+def search_posts(terms, cursor=None, per_page=10, page=None):
+    """Posts matching `terms`, best BM25 match first, as a KeysetPage.
+
+    Pages seek on (rank, id) like the other listings. A bare `page` number
+    (old links, see paginate()) is served with OFFSET and its cursors carry on
+    from there. Each post gets search_title/search_snippet with the matched
+    words in <mark>.
+    """
+    match = build_match_query(terms)
+    if not match:
+        return KeysetPage([], per_page)
+
+    position = decode_cursor(cursor, parse_key=float) if cursor else None
+    params = {'match': match, 'limit': per_page + 1}
+    seek = ''
+    offset = ''
+    direction = 'n'
+    if position is None and page is not None and page > 1:
+        offset = 'OFFSET :offset'
+        params['offset'] = (page - 1) * per_page
+    elif position is not None:
+        direction, params['rank'], params['id'] = position
+        operator = '>' if direction == 'n' else '<'
+        seek = f'WHERE rank {operator} :rank OR (rank = :rank AND id {operator} :id)'
+    order = 'rank, id' if direction == 'n' else 'rank DESC, id DESC'
+
+    rows = db.session.execute(text(f"""
+        SELECT id, rank FROM (
+            SELECT rowid AS id, rank FROM posts_fts WHERE posts_fts MATCH :match
+        ) {seek}
+        ORDER BY {order}
+        LIMIT :limit {offset}
+    """), params).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'p':
+        rows.reverse()
+        has_before, has_after = has_more, True
+    else:
+        has_before, has_after = position is not None or bool(offset), has_more
+
+    if not rows:
+        return KeysetPage([], per_page)
+
+    ids = [row.id for row in rows]
+    fragments = {
+        row.id: row for row in db.session.execute(text(f"""
+            SELECT rowid AS id,
+                   highlight(posts_fts, 0, char(2), char(3)) AS title,
+                   snippet(posts_fts, 1, char(2), char(3), '…', 24) AS snippet
+            FROM posts_fts
+            WHERE posts_fts MATCH :match AND rowid IN ({', '.join(str(post_id) for post_id in ids)})
+        """), {'match': match})
+    }
+    posts = {post.id: post for post in feed_query().filter(Post.id.in_(ids))}
+
+    items = []
+    for post_id in ids:
+        post = posts.get(post_id)
+        if post is None:
+            continue
+        fragment = fragments.get(post_id)
+        if fragment is not None:
+            post.search_title = _highlight(fragment.title)
+            post.search_snippet = _highlight(fragment.snippet)
+        items.append(post)
+
+    first, last = rows[0], rows[-1]
+    return KeysetPage(
+        items, per_page,
+        next_cursor=encode_cursor('n', last.rank, last.id) if has_after else None,
+        prev_cursor=encode_cursor('p', first.rank, first.id) if has_before else None
+    )
@@ -0,0 +1,263 @@
+# app/sessions.py - server-side sessions; the cookie only carries an opaque id
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from app import db
+from app.models import ServerSession, dialect_insert
+
+SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{32,64}$')
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and whether it changed"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.loaded_user_id = (initial or {}).get('_user_id')
+
+
+class DatabaseSessionStore:
+    """Sessions in the `sessions` table, written with short Core transactions"""
+
+    table = ServerSession.__table__
+
+    def load(self, sid):
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                db.select(self.table.c.user_id, self.table.c.data, self.table.c.expires_at)
+                .where(self.table.c.id == sid)
+            ).first()
+        return tuple(row) if row else None
+
+    def save(self, sid, user_id, data, expires_at):
+        statement = dialect_insert(self.table).values(id=sid, user_id=user_id, data=data, expires_at=expires_at)
+        with db.engine.begin() as connection:
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=['id'],
+                set_={'user_id': statement.excluded.user_id, 'data': statement.excluded.data,
+                      'expires_at': statement.excluded.expires_at}
+            ))
+
+    def delete(self, sid):
+        with db.engine.begin() as connection:
+            connection.execute(db.delete(self.table).where(self.table.c.id == sid))
+
+    def delete_user(self, user_id):
+        with db.engine.begin() as connection:
+            return connection.execute(db.delete(self.table).where(self.table.c.user_id == user_id)).rowcount
+
+    def sweep(self, batch_size=500):
+        """Delete expired sessions `batch_size` at a time; returns how many went"""
+        deleted = 0
+        while True:
+            with db.engine.begin() as connection:
+                expired = db.select(self.table.c.id) \
+                    .where(self.table.c.expires_at < datetime.utcnow()) \
+                    .limit(batch_size).scalar_subquery()
+                count = connection.execute(db.delete(self.table).where(self.table.c.id.in_(expired))).rowcount
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+
+class FileSessionStore:
+    """One JSON file per session under `directory`"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as handle:
+                record = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        return record['user_id'], record['data'], datetime.fromisoformat(record['expires_at'])
+
+    def load(self, sid):
+        return self._read(self._path(sid))
+
+    def save(self, sid, user_id, data, expires_at):
+        path = self._path(sid)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump({'user_id': user_id, 'data': data, 'expires_at': expires_at.isoformat()}, handle)
+        os.replace(temporary, path)
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def _remove_where(self, matches):
+        deleted = 0
+        for name in os.listdir(self.directory):
+            if not SESSION_ID.match(name):
+                continue
+            record = self._read(self._path(name))
+            if record is not None and matches(record):
+                self.delete(name)
+                deleted += 1
+        return deleted
+
+    def delete_user(self, user_id):
+        return self._remove_where(lambda record: record[0] == user_id)
+
+    def sweep(self, batch_size=500):
+        now = datetime.utcnow()
+        return self._remove_where(lambda record: record[2] < now)
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data in `store`; the cookie holds only a random session id.
+
+    Recently used sessions are kept in a small per-process LRU so most
+    requests read no session storage at all, and a session is only written
+    back when it changes or is past half its lifetime. The id is replaced
+    when someone logs in, so a session id planted before login is useless.
+    Other processes may keep serving a deleted session from their LRU for
+    up to `cache_ttl` seconds, which is why revoke_user() also changes the
+    user's login id.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, cache_size=1024, cache_ttl=30):
+        self.store = store
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Front cache: sid -> (cached_until, (user_id, data, expires_at))
+    def _cached(self, sid):
+        with self._lock:
+            entry = self._cache.get(sid)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._cache[sid]
+                return None
+            self._cache.move_to_end(sid)
+            return entry[1]
+
+    def _remember(self, sid, record):
+        with self._lock:
+            self._cache[sid] = (time.monotonic() + self.cache_ttl, record)
+            self._cache.move_to_end(sid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, sid=None, user_id=None):
+        with self._lock:
+            if sid is not None:
+                self._cache.pop(sid, None)
+            if user_id is not None:
+                for cached_sid in [key for key, (_, record) in self._cache.items() if record[0] == user_id]:
+                    del self._cache[cached_sid]
+
+    def _load(self, sid):
+        record = self._cached(sid)
+        if record is None:
+            record = self.store.load(sid)
+            if record is not None:
+                self._remember(sid, record)
+        return record
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SESSION_ID.match(sid):
+            record = self._load(sid)
+            if record is not None and record[2] > datetime.utcnow():
+                return ServerSideSession(self.serializer.loads(record[1]), sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                self._forget(sid=session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        user_id = session.get('_user_id')
+        if session.new or session.modified:
+            if not session.new and user_id != session.loaded_user_id:
+                # Logged in (or switched user): retire the old id
+                self.store.delete(session.sid)
+                self._forget(sid=session.sid)
+                session.sid = secrets.token_urlsafe(32)
+            self._write(app, session, user_id)
+        else:
+            record = self._load(session.sid)
+            lifetime = app.permanent_session_lifetime
+            if record is None or record[2] - datetime.utcnow() < lifetime / 2:
+                self._write(app, session, user_id)
+            else:
+                return  # cookie and stored copy are both still good
+
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+        response.vary.add('Cookie')
+
+    def _write(self, app, session, user_id):
+        user_id = int(str(user_id).partition(':')[0]) if user_id is not None else None
+        record = (user_id, self.serializer.dumps(dict(session)),
+                  datetime.utcnow() + app.permanent_session_lifetime)
+        self.store.save(session.sid, *record)
+        self._remember(session.sid, record)
+
+    def revoke_user(self, user):
+        """Sign `user` out everywhere; returns how many stored sessions were removed.
+
+        Bumping session_version changes the user's login id, which also voids
+        remember-me cookies. Commits.
+        """
+        user.session_version = (user.session_version or 0) + 1
+        db.session.commit()
+        self._forget(user_id=user.id)
+        return self.store.delete_user(user.id)
+
+
+def create_session_interface(app):
+    """Build the session interface chosen by SESSION_BACKEND ('database' or 'filesystem')"""
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'filesystem':
+        store = FileSessionStore(app.config['SESSION_FILE_DIR'])
+    elif backend == 'database':
+        store = DatabaseSessionStore()
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND {backend!r}')
+
+    return ServerSessionInterface(store, app.config['SESSION_CACHE_SIZE'], app.config['SESSION_CACHE_TTL'])
@@ -0,0 +1,32 @@
+# app/stats.py - a periodic log line with each process's in-memory counters
+import logging
+import threading
+import time
+
+
+def init_stats_log(app, sources):
+    """Log every `sources` entry (name -> stats function) once per STATS_LOG_INTERVAL seconds.
+
+    The counters live inside each web process, so that is where they are
+    reported from: the first request after the interval writes the lines,
+    at INFO on app.logger.
+    """
+    interval = app.config['STATS_LOG_INTERVAL']
+    if not interval:
+        return
+    if app.logger.level == logging.NOTSET:
+        app.logger.setLevel(logging.INFO)
+
+    lock = threading.Lock()
+    due = {'at': time.monotonic() + interval}
+
+    @app.after_request
+    def _log_stats(response):
+        now = time.monotonic()
+        with lock:
+            if now < due['at']:
+                return response
+            due['at'] = now + interval
+        for name, stats in sources.items():
+            app.logger.info('%s stats: %s', name, stats())
+        return response
@@ -0,0 +1,137 @@
+# app/user_cache.py - per-process cache of logged-in users for Flask-Login
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.models import User
+
+# Re-read from the database on cache hits, at most every `recheck` seconds (see UserCache)
+AUTHORITY_COLUMNS = (User.session_version, User.role)
+
+
+class UserCache:
+    """LRU cache of detached User snapshots that expire after `ttl` seconds.
+
+    load() merges a cached snapshot into the request's session without a
+    query (merge with load=False), so current_user is still an ordinary
+    model - lazy relationships and later writes work as usual. A User
+    written through the ORM is dropped from this process's cache when the
+    transaction commits; other processes pick the change up when their copy
+    expires. The fields that grant access (AUTHORITY_COLUMNS) are trusted for
+    only `recheck` seconds: the first hit after that re-reads them by primary
+    key, so a revocation or role change made anywhere - another worker, the
+    CLI, a bulk UPDATE - applies within `recheck` seconds, while the hits in
+    between run no query at all.
+    """
+
+    def __init__(self, ttl=60, maxsize=1024, recheck=5):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.recheck = recheck
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, ttl, maxsize, recheck):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.recheck = recheck
+        self.clear()
+
+    def load(self, user_id, session):
+        """The user with `user_id` attached to `session`, or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                expires, snapshot, checked_until = entry
+            else:
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                snapshot = None
+
+        if snapshot is not None:
+            if checked_until > now:
+                return session.merge(snapshot, load=False)
+            current = session.execute(
+                select(*AUTHORITY_COLUMNS).where(User.id == user_id)
+            ).first()
+            if current is None:
+                self.invalidate(user_id)
+                return None
+            if tuple(current) == tuple(getattr(snapshot, column.key) for column in AUTHORITY_COLUMNS):
+                with self._lock:
+                    if self._entries.get(user_id) is entry:
+                        self._entries[user_id] = (expires, snapshot, now + self.recheck)
+                return session.merge(snapshot, load=False)
+            self.invalidate(user_id)  # changed elsewhere: load the user afresh
+
+        user = session.get(User, user_id)
+        if user is not None and self.ttl > 0:
+            self._store(user_id, _snapshot(user), now)
+        return user
+
+    def _store(self, user_id, snapshot, now):
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, snapshot, now + self.recheck)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'recheck': self.recheck
+            }
+
+
+def _snapshot(user):
+    """A detached copy of `user`'s column values, safe to share between threads"""
+    copy = User(**{column.key: getattr(user, column.key) for column in User.__mapper__.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, User) and instance.id is not None:
+            session.info.setdefault('cached_users_changed', set()).add(instance.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    changed = session.info.pop('cached_users_changed', None)
+    if changed:
+        user_cache.invalidate(*changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('cached_users_changed', None)
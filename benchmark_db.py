@@ -0,0 +1,162 @@
+# benchmark_db.py - mixed read/write throughput on SQLite, old defaults vs tuned settings
+"""
+Runs several worker processes - like gunicorn workers - against a fresh
+temporary database, each mixing reads (the newest posts) with writes (a
+comment plus the post's counter update), once per settings profile.
+
+    python benchmark_db.py --workers 4 --seconds 10 --write-ratio 0.2
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import shutil
+import tempfile
+import time
+
+# Settings profiles, passed to the app through its environment variables
+PROFILES = {
+    # What the app ran with before: sqlite3's rollback journal, full fsync, 5s timeout
+    'default': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_BUSY_TIMEOUT': '5',
+                'SQLITE_CACHE_SIZE_KB': '2000', 'SQLITE_MMAP_SIZE': '0'},
+    # The app's current defaults: WAL, synchronous=NORMAL, 15s busy timeout, bigger cache, mmap
+    'tuned': {},
+}
+
+
+def load_app(database_path, profile):
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    os.environ.update(PROFILES[profile])
+    from app import app, db
+    return app, db
+
+
+def seed(database_path, profile, posts):
+    """Create the schema and some posts to read (runs in its own process)"""
+    app, db = load_app(database_path, profile)
+    from app.models import User, Post
+
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', first_name='Bench', last_name='Mark')
+        user.password_hash = 'x'
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all(Post(title=f'Post {i}', content='Benchmark post ' * 20, user_id=user.id)
+                           for i in range(posts))
+        db.session.commit()
+
+
+def worker(database_path, profile, seconds, write_ratio, start, results):
+    app, db = load_app(database_path, profile)
+    from sqlalchemy.exc import OperationalError
+    from app.models import Post, Comment, User
+
+    stats = {'reads': 0, 'writes': 0, 'locked': 0, 'read_seconds': 0.0, 'write_seconds': 0.0,
+             'max_write_seconds': 0.0}
+    rng = random.Random(os.getpid())
+
+    with app.app_context():
+        user_id = User.query.filter_by(username='bench').one().id
+        post_ids = [row.id for row in db.session.query(Post.id)]
+        start.wait()
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            began = time.monotonic()
+            try:
+                if rng.random() < write_ratio:
+                    post_id = rng.choice(post_ids)
+                    db.session.add(Comment(content='Benchmark comment', user_id=user_id, post_id=post_id))
+                    Post.query.filter_by(id=post_id).update({Post.comment_count: Post.comment_count + 1})
+                    db.session.commit()
+                    elapsed = time.monotonic() - began
+                    stats['writes'] += 1
+                    stats['write_seconds'] += elapsed
+                    stats['max_write_seconds'] = max(stats['max_write_seconds'], elapsed)
+                else:
+                    Post.query.order_by(Post.created_at.desc(), Post.id.desc()).limit(20).all()
+                    db.session.rollback()
+                    stats['reads'] += 1
+                    stats['read_seconds'] += time.monotonic() - began
+            except OperationalError as error:
+                db.session.rollback()
+                if 'locked' not in str(error) and 'busy' not in str(error):
+                    raise
+                stats['locked'] += 1
+
+    results.put(stats)
+
+
+def run_profile(profile, workers, seconds, write_ratio, posts):
+    directory = tempfile.mkdtemp(prefix='kuhes-bench-')
+    database_path = os.path.join(directory, 'bench.db')
+    context = multiprocessing.get_context('spawn')  # each worker imports the app with its own settings
+    try:
+        setup = context.Process(target=seed, args=(database_path, profile, posts))
+        setup.start()
+        setup.join()
+        if setup.exitcode != 0:
+            raise RuntimeError(f'seeding the {profile} database failed (exit code {setup.exitcode})')
+
+        start = context.Event()
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(database_path, profile, seconds, write_ratio, start, results))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        time.sleep(3)  # let every worker finish importing the app
+        start.set()
+
+        totals = []
+        try:
+            for _ in processes:
+                totals.append(results.get(timeout=seconds + 30))
+        except queue.Empty:
+            pass  # a worker died before reporting - its exit code says so below
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        failed = [process.exitcode for process in processes if process.exitcode != 0]
+        if failed or len(totals) != len(processes):
+            raise RuntimeError(f'{len(failed)} of {workers} {profile} workers failed (exit codes {failed})')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    reads = sum(stats['reads'] for stats in totals)
+    writes = sum(stats['writes'] for stats in totals)
+    return {
+        'reads_per_second': reads / seconds,
+        'writes_per_second': writes / seconds,
+        'locked_errors': sum(stats['locked'] for stats in totals),
+        'avg_read_ms': 1000 * sum(stats['read_seconds'] for stats in totals) / (reads or 1),
+        'avg_write_ms': 1000 * sum(stats['write_seconds'] for stats in totals) / (writes or 1),
+        'max_write_ms': 1000 * max(stats['max_write_seconds'] for stats in totals),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SQLite read/write throughput under mixed load.')
+    parser.add_argument('--workers', type=int, default=4, help='worker processes (default 4)')
+    parser.add_argument('--seconds', type=float, default=10, help='length of each run (default 10)')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='share of operations that write (default 0.2)')
+    parser.add_argument('--posts', type=int, default=1000, help='posts seeded before the run (default 1000)')
+    parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                        help='profile(s) to run (default: all)')
+    args = parser.parse_args()
+
+    print("📊 SQLite mixed-load benchmark")
+    print(f"   {args.workers} workers, {args.seconds:g}s per profile, {args.write_ratio:.0%} writes")
+    print("=" * 78)
+    print(f"{'profile':<10}{'reads/s':>10}{'writes/s':>10}{'locked':>8}{'avg read ms':>13}{'avg write ms':>14}{'max write ms':>14}")
+    for profile in args.profile or PROFILES:
+        result = run_profile(profile, args.workers, args.seconds, args.write_ratio, args.posts)
+        print(f"{profile:<10}{result['reads_per_second']:>10.0f}{result['writes_per_second']:>10.0f}"
+              f"{result['locked_errors']:>8}{result['avg_read_ms']:>13.2f}{result['avg_write_ms']:>14.2f}"
+              f"{result['max_write_ms']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
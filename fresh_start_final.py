@@ -239,6 +239,10 @@ def fresh_start_final():
         # Commit everything
         db.session.commit()
 
+        # The comments went in directly, so fill in the counters the feeds read
+        Post.rebuild_counters()
+        User.rebuild_unread_counts()
+
         print("\n✅ Setup complete!")
         print("\n📋 Test Credentials:")
         print("   1. Student Account:")
@@ -376,6 +376,10 @@ Let's ace Biochemistry together! 💪""",
 
         db.session.commit()
 
+        # The rows above went in directly, so fill in the counters the feeds read
+        Post.rebuild_counters()
+        User.rebuild_unread_counts()
+
         print("\n" + "=" * 60)
         print("✅ DATABASE INITIALIZATION COMPLETE!")
         print("=" * 60)
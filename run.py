@@ -19,6 +19,8 @@ if __name__ == '__main__':
     print("   • Event Management System")
     print("   • Discussion Forums")
     print("   • Comments & Interactions")
+    print("\n🔔 Notifications are delivered by: flask --app run notification-worker")
+    print("📅 Event phases are kept current by: flask --app run sweep-event-phases --interval 60")
     print("=" * 60 + "\n")
 
     app.run(host="0.0.0.0", port=port)  # Use the port variable
\ No newline at end of file
@@ -0,0 +1,59 @@
+# tests/conftest.py - run the app against a throwaway SQLite database
+import os
+import shutil
+import tempfile
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# app/__init__.py builds the app at import time, so point it at a scratch
+# database before anything imports it
+_database_dir = tempfile.mkdtemp(prefix='kuhes-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir, 'test.db')}"
+
+from app import app as flask_app, db  # noqa: E402
+from app.models import User  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    yield flask_app
+    shutil.rmtree(_database_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        user = User.query.filter_by(username='tester').first()
+        if user is None:
+            user = User(username='tester', email='tester@example.com', first_name='Test', last_name='User')
+            user.password_hash = 'x'  # never logs in through the form
+            db.session.add(user)
+            db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def count_queries():
+    """Call with a function; returns how many SQL statements it ran (on any engine)"""
+    def count(function):
+        statements = []
+
+        def _record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(Engine, 'before_cursor_execute', _record)
+        try:
+            function()
+        finally:
+            event.remove(Engine, 'before_cursor_execute', _record)
+        return len(statements)
+
+    return count
@@ -0,0 +1,71 @@
+# tests/test_conflicts.py - venue keys, the interval index, and the booking backfill
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.conflicts import IntervalIndex, normalize_venue, rebuild_bookings
+from app.models import Event
+
+
+@pytest.mark.parametrize('spellings', [
+    ('The Main Hall', 'main-hall', 'MAIN  HALL'),
+    ('LT 1', 'Lecture Theatre 01', 'lecture theater no. 1'),
+    ('Rm 12, Bldg B', 'Room 012 Building B'),
+    ('Computer Lab', 'computer laboratory'),
+])
+def test_spellings_of_one_venue_share_a_key(spellings):
+    assert len({normalize_venue(spelling) for spelling in spellings}) == 1
+
+
+def test_different_venues_keep_different_keys():
+    assert normalize_venue('Room 1') != normalize_venue('Room 10')
+    assert normalize_venue(None) == normalize_venue('') == ''
+
+
+def test_overlapping_is_half_open():
+    index = IntervalIndex([(0, 10, 'a'), (10, 20, 'b'), (5, 6, 'c')])
+    assert sorted(index.overlapping(10, 11)) == ['b']  # 'a' has ended when 'b' starts
+    assert sorted(index.overlapping(9, 10)) == ['a']
+    assert sorted(index.overlapping(5, 6)) == ['a', 'c']
+    assert index.overlapping(20, 30) == []
+    assert len(index) == 3
+
+
+def test_overlapping_matches_a_scan():
+    generator = random.Random(7)
+    intervals = []
+    for item in range(300):
+        start = generator.randrange(1000)
+        # Mostly short bookings with a few long ones, as the venue index sees them
+        length = generator.choice([1, 2, 5, 10, 30]) if generator.random() < 0.95 else generator.randrange(100, 400)
+        intervals.append((start, start + length, item))
+    index = IntervalIndex(intervals)
+
+    for _ in range(500):
+        start = generator.randrange(-50, 1100)
+        end = start + generator.randrange(1, 60)
+        expected = sorted(item for item_start, item_end, item in intervals if item_start < end and item_end > start)
+        assert sorted(index.overlapping(start, end)) == expected
+
+
+def test_rebuild_bookings_fills_keys_without_touching_updated_at(app, user):
+    with app.app_context():
+        start = datetime(2024, 6, 1, 9)
+        events = [Event(title=f'Talk {i}', description='-', event_type='academic', venue='LT 1',
+                        start_date=start, end_date=start + timedelta(minutes=90) if i % 2 else None,
+                        status='approved', user_id=user) for i in range(5)]
+        db.session.add_all(events)
+        db.session.commit()
+        ids = [event.id for event in events]
+        edited = datetime(2024, 1, 1)
+        db.session.execute(db.update(Event).where(Event.id.in_(ids))
+                           .values(venue_key=None, duration_minutes=None, updated_at=edited))
+        db.session.commit()
+
+        rebuild_bookings(batch_size=2)
+
+        rows = db.session.query(Event.venue_key, Event.duration_minutes, Event.updated_at) \
+            .filter(Event.id.in_(ids)).order_by(Event.id).all()
+        assert rows == [('lecture theatre 1', 90 if i % 2 else 60, edited) for i in range(5)]
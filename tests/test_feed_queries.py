@@ -0,0 +1,71 @@
+# tests/test_feed_queries.py - a feed page costs the same number of queries however many posts it shows
+import re
+
+import pytest
+
+from app import db
+from app.cache import invalidate, HOME_STATS, FORUM_CATEGORIES
+from app.models import Comment, Post, PostReaction, User
+
+# Listings of 10 posts a page; the search appears twice, for the FTS5 and the LIKE paths
+FEED_PAGES = ['/news', '/forum/', '/forum/search?q=feed', '/forum/search?q=feed&like']
+PER_PAGE = 10
+SMALL, LARGE = 3, 40  # part of one page, several pages
+
+
+def seed_posts(app, user_id, count):
+    """Replace every post with `count` posts by different authors, each with a comment and a reaction"""
+    with app.app_context():
+        PostReaction.query.delete()
+        Comment.query.delete()
+        Post.query.delete()
+        authors = User.query.filter(User.username.like('author%')).order_by(User.id).all()
+        for i in range(len(authors), count):
+            author = User(username=f'author{i}', email=f'author{i}@example.com', first_name='Author', last_name=str(i))
+            author.password_hash = 'x'
+            authors.append(author)
+        db.session.add_all(authors)
+        db.session.flush()
+
+        # A different author per post, so a lazy author load can't be served from the identity map
+        posts = [Post(title=f'Post {i}', content='Feed post', category='general', user_id=authors[i].id)
+                 for i in range(count)]
+        db.session.add_all(posts)
+        db.session.flush()
+        for post in posts:
+            db.session.add(Comment(content='A comment', user_id=user_id, post_id=post.id))
+            db.session.add(PostReaction(post_id=post.id, user_id=user_id, reaction_type='heartbeat'))
+            post.comment_count, post.heartbeat_count = 1, 1
+        invalidate(HOME_STATS, FORUM_CATEGORIES)
+        db.session.commit()
+
+
+def page_queries(client, count_queries, url, shown):
+    """Statements run rendering `url`, checking it lists `shown` posts (each by its own author)"""
+    client.get(url)  # fill the shared caches first; their refresh is not per post
+
+    def render():
+        response = client.get(url)
+        assert response.status_code == 200
+        assert len(set(re.findall(r'\bauthor(\d+)\b', response.get_data(as_text=True)))) == shown
+
+    return count_queries(render)
+
+
+@pytest.mark.parametrize('logged_in', [False, True], ids=['anonymous', 'logged-in'])
+@pytest.mark.parametrize('url', FEED_PAGES)
+def test_feed_query_count_is_constant(app, client, user, count_queries, url, logged_in, monkeypatch):
+    if url.endswith('&like'):
+        monkeypatch.setitem(app.config, 'SEARCH_FTS_ENABLED', False)
+    if logged_in:
+        with client.session_transaction() as session:
+            session['_user_id'] = f'{user}:0'
+            session['_fresh'] = True
+
+    counts = {}
+    for posts in (SMALL, LARGE):
+        seed_posts(app, user, posts)
+        counts[posts] = page_queries(client, count_queries, url, min(posts, PER_PAGE))
+
+    assert counts[SMALL] == counts[LARGE], \
+        f'{url} ran {counts[SMALL]} queries with {SMALL} posts but {counts[LARGE]} with {LARGE}'
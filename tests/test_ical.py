@@ -0,0 +1,30 @@
+# tests/test_ical.py - only feeds with events are cached on disk
+import os
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Event
+
+
+def test_only_feeds_with_events_are_cached(app, client, user, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ICAL_CACHE_DIR', str(tmp_path))
+    with app.app_context():
+        Event.query.filter_by(event_type='ical-test').delete()
+        start = datetime(2024, 5, 1, 9)
+        db.session.add(Event(title='Open day', description='Tours', event_type='ical-test', venue='Main Hall',
+                             start_date=start, end_date=start + timedelta(hours=2), status='approved',
+                             user_id=user))
+        db.session.commit()
+
+    for junk in ('no-such-type', 'x' * 40, 'another'):
+        response = client.get(f'/events/types/{junk}.ics')
+        assert response.status_code == 200
+        assert 'BEGIN:VEVENT' not in response.get_data(as_text=True)
+        assert client.get(f'/events/categories/{junk}.ics').status_code == 200
+    assert os.listdir(tmp_path) == []
+
+    response = client.get('/events/types/ical-test.ics')
+    assert 'SUMMARY:Open day' in response.get_data(as_text=True)
+    assert len(os.listdir(tmp_path)) == 1
+    assert client.get('/events/types/ical-test.ics', headers={'If-None-Match': response.headers['ETag']}) \
+        .status_code == 304
@@ -0,0 +1,49 @@
+# tests/test_notify.py - streams hear about changes made by other processes through one poll
+from app import db
+from app.models import User
+from app.notify import LocalBroker, VersionPoller
+
+
+def bump_version(user_id):
+    """Change a user's notification version the way another process would - no publish here"""
+    db.session.execute(db.update(User).where(User.id == user_id)
+                       .values(notification_version=User.notification_version + 1))
+    db.session.commit()
+
+
+def test_poll_wakes_streams_whose_version_moved(app, user, count_queries):
+    broker = LocalBroker()
+    poller = VersionPoller(broker)
+    subscriptions = [broker.subscribe(user) for _ in range(3)]
+
+    with app.app_context():
+        version = User.get_notification_state(user)[1]
+        poller.seen(user, version)
+        assert poller.poll() == []
+
+        bump_version(user)
+        polls = []
+        assert count_queries(lambda: polls.append(poller.poll())) == 1
+        assert polls == [[user]]
+        assert all(subscription.get_nowait() for subscription in subscriptions)
+
+        # Already published; nothing new until the version moves again
+        assert poller.poll() == []
+        assert all(subscription.empty() for subscription in subscriptions)
+
+
+def test_poll_skips_versions_the_stream_already_sent(app, user):
+    broker = LocalBroker()
+    poller = VersionPoller(broker)
+    broker.subscribe(user)
+
+    with app.app_context():
+        bump_version(user)
+        poller.seen(user, User.get_notification_state(user)[1])
+        assert poller.poll() == []
+
+
+def test_poll_without_streams_runs_no_query(app, count_queries):
+    poller = VersionPoller(LocalBroker())
+    with app.app_context():
+        assert count_queries(poller.poll) == 0
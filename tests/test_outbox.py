@@ -0,0 +1,94 @@
+# tests/test_outbox.py - each queued notification is delivered once, and a bad one is retried then given up on
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, outbox
+from app.models import Notification, NotificationActor, NotificationOutbox, User
+from app.outbox import AlreadyClaimed, MAX_ATTEMPTS, deliver, pending_entries, process_outbox
+
+
+@pytest.fixture
+def queue_for(app, user):
+    """Empty the outbox and notifications; returns a function queueing n entries for the test user"""
+    with app.app_context():
+        NotificationActor.query.delete()
+        Notification.query.delete()
+        NotificationOutbox.query.delete()
+        db.session.commit()
+
+    def enqueue(count):
+        actor = db.session.get(User, user)
+        for i in range(count):
+            NotificationOutbox.enqueue(f'test-{i}', user, 'Reaction', f'Reaction {i}',
+                                       notification_type='post_reaction', related_id=i, actor=actor)
+        db.session.commit()
+
+    with app.app_context():
+        yield enqueue
+
+
+def test_deliver_claims_entries_once(queue_for):
+    queue_for(2)
+    entries = pending_entries(10)
+    assert deliver(entries, window=None) == 2
+    db.session.commit()
+
+    with pytest.raises(AlreadyClaimed):
+        deliver(entries, window=None)
+    db.session.rollback()
+    assert Notification.query.count() == 2
+
+
+def test_process_outbox_rereads_after_another_worker_claims(queue_for, monkeypatch):
+    queue_for(3)
+    real_pending = outbox.pending_entries
+    reads = []
+
+    def pending_then_claimed_elsewhere(batch_size):
+        entries = real_pending(batch_size)
+        if not reads:
+            # Another worker delivers the first entry after this one read the batch
+            db.session.execute(db.update(NotificationOutbox).where(NotificationOutbox.id == entries[0].id)
+                               .values(processed_at=datetime.utcnow()))
+            db.session.commit()
+        reads.append(len(entries))
+        return entries
+
+    monkeypatch.setattr(outbox, 'pending_entries', pending_then_claimed_elsewhere)
+    assert process_outbox(batch_size=10) == (2, 0)
+    assert reads == [3, 2]
+    assert NotificationOutbox.query.filter(NotificationOutbox.processed_at.is_(None)).count() == 0
+
+
+def test_failing_entry_backs_off_then_is_given_up(queue_for, monkeypatch):
+    queue_for(3)
+    bad_id = NotificationOutbox.query.filter_by(related_id=1).one().id
+    real_add_actor = Notification.add_actor
+
+    def add_actor(notification, actor_id):
+        if notification.related_id == 1:
+            raise RuntimeError('bad entry')
+        return real_add_actor(notification, actor_id)
+
+    monkeypatch.setattr(Notification, 'add_actor', add_actor)
+
+    # The batch fails as a whole, so the entries go one at a time and only the bad one waits
+    assert process_outbox(batch_size=10) == (2, 1)
+    bad = db.session.get(NotificationOutbox, bad_id)
+    assert (bad.attempts, bad.processed_at, bad.last_error) == (1, None, 'bad entry')
+    assert bad.available_at > datetime.utcnow() + timedelta(seconds=1)
+    assert process_outbox(batch_size=10) == (0, 0)  # not due yet
+
+    for attempt in range(2, MAX_ATTEMPTS + 1):
+        bad.available_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert process_outbox(batch_size=10) == (0, 1)
+        bad = db.session.get(NotificationOutbox, bad_id)
+        assert bad.attempts == attempt
+        assert bad.available_at > datetime.utcnow() + timedelta(seconds=2 ** attempt - 1)
+
+    bad.available_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert pending_entries(10) == []
+    assert process_outbox(batch_size=10) == (0, 0)
@@ -0,0 +1,85 @@
+# tests/test_pagination.py - keyset cursors and the pages they lead to
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Comment, Post, PostReaction
+from app.pagination import decode_cursor, encode_cursor, keyset_paginate, paginate
+
+
+def test_cursor_round_trip():
+    moment = datetime(2024, 3, 1, 9, 30, 15, 123456)
+    assert decode_cursor(encode_cursor('n', moment, 42)) == ('n', moment, 42)
+    assert decode_cursor(encode_cursor('p', -3.25, 7), parse_key=float) == ('p', -3.25, 7)
+
+
+@pytest.mark.parametrize('token', ['', 'not base64!', encode_cursor('x', datetime(2024, 1, 1), 1),
+                                   encode_cursor('n', 'yesterday', 1), encode_cursor('n', datetime(2024, 1, 1), 'one')])
+def test_malformed_cursor_is_none(token):
+    assert decode_cursor(token) is None
+
+
+@pytest.fixture
+def posts(app, user):
+    """25 posts, newest first by (created_at, id); every third pair shares a timestamp"""
+    with app.app_context():
+        PostReaction.query.delete()
+        Comment.query.delete()
+        Post.query.delete()
+        start = datetime(2024, 1, 1)
+        rows = [Post(title=f'Post {i}', content='Paged', user_id=user, created_at=start + timedelta(minutes=i // 2))
+                for i in range(25)]
+        db.session.add_all(rows)
+        db.session.commit()
+        ids = [post.id for post in sorted(rows, key=lambda post: (post.created_at, post.id), reverse=True)]
+    return ids
+
+
+def _page(cursor=None, descending=True):
+    query = Post.query.order_by(Post.created_at.desc(), Post.id.desc())
+    return keyset_paginate(query, Post.created_at, Post.id, cursor, per_page=10, descending=descending)
+
+
+def test_next_and_prev_walk_the_same_pages(app, posts):
+    with app.app_context():
+        first = _page()
+        assert [post.id for post in first] == posts[:10]
+        assert first.has_next and not first.has_prev
+
+        second = _page(first.next_cursor)
+        assert [post.id for post in second] == posts[10:20]
+        assert second.has_next and second.has_prev
+
+        last = _page(second.next_cursor)
+        assert [post.id for post in last] == posts[20:]
+        assert not last.has_next and last.has_prev
+
+        back = _page(last.prev_cursor)
+        assert [post.id for post in back] == posts[10:20]
+        assert back.has_next and back.has_prev
+
+        start = _page(back.prev_cursor)
+        assert [post.id for post in start] == posts[:10]
+        assert not start.has_prev
+
+
+def test_oldest_first(app, posts):
+    with app.app_context():
+        first = _page(descending=False)
+        assert [post.id for post in first] == posts[::-1][:10]
+        assert [post.id for post in _page(first.next_cursor, descending=False)] == posts[::-1][10:20]
+
+
+def test_unknown_cursor_starts_at_the_first_page(app, posts):
+    with app.app_context():
+        assert [post.id for post in _page('garbage')] == posts[:10]
+
+
+@pytest.mark.parametrize('descending', [True, False], ids=['newest-first', 'oldest-first'])
+def test_numbered_pages_follow_the_listing_order(app, posts, descending):
+    expected = posts if descending else posts[::-1]
+    for page in (1, 2, 3):
+        with app.test_request_context(f'/?page={page}'):
+            listing = paginate(Post.query, Post.created_at, Post.id, per_page=10, descending=descending)
+            assert [post.id for post in listing.items] == expected[(page - 1) * 10:page * 10]
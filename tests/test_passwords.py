@@ -0,0 +1,27 @@
+# tests/test_passwords.py - needs_rehash reads the configured method without hashing anything
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import passwords
+from app.passwords import PasswordHasher, method_prefix
+
+METHODS = ['pbkdf2', 'pbkdf2:sha512', 'pbkdf2:sha256:1000', 'scrypt', 'scrypt:16384:8:1']
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_prefix_matches_werkzeug(method):
+    assert method_prefix(method) == generate_password_hash('secret', method).split('$', 1)[0]
+
+
+def test_needs_rehash_compares_prefixes_only(monkeypatch):
+    hasher = PasswordHasher('pbkdf2:sha256:600000')
+    old = generate_password_hash('secret', 'pbkdf2:sha256:1000')
+    current = generate_password_hash('secret', 'pbkdf2')
+
+    def no_hashing(*args):
+        raise AssertionError('needs_rehash hashed a password')
+
+    monkeypatch.setattr(passwords, 'generate_password_hash', no_hashing)
+    assert hasher.needs_rehash(old)
+    assert not hasher.needs_rehash(current)
+    assert not hasher.needs_rehash(None)
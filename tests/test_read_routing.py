@@ -0,0 +1,18 @@
+# tests/test_read_routing.py - any request that wrote keeps the browser's next reads on the primary
+from app.database import PRIMARY_COOKIE
+
+
+def primary_cookie(response):
+    return any(header.startswith(f'{PRIMARY_COOKIE}=') for header in response.headers.getlist('Set-Cookie'))
+
+
+def test_reading_get_does_not_pin(client):
+    assert not primary_cookie(client.get('/news'))
+
+
+def test_get_that_writes_pins_to_primary(client, user):
+    with client.session_transaction() as session:
+        session['_user_id'] = f'{user}:0'
+        session['_fresh'] = True
+    # Viewing the notifications page marks them read
+    assert primary_cookie(client.get('/notifications'))
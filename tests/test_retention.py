@@ -0,0 +1,55 @@
+# tests/test_retention.py - the per-user cap keeps exactly the newest notifications
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import Notification, NotificationActor
+from app.retention import cap_notifications_per_user
+
+
+@pytest.fixture
+def notifications(app, user):
+    """Replace the test user's notifications with ones created at the given minute offsets; returns their ids"""
+    def create(*minutes):
+        NotificationActor.query.delete()
+        Notification.query.delete()
+        start = datetime(2024, 1, 1)
+        rows = [Notification(user_id=user, title='Hi', message='Hello', created_at=start + timedelta(minutes=minute))
+                for minute in minutes]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+    with app.app_context():
+        yield create
+
+
+def kept_ids():
+    return sorted(notification_id for (notification_id,) in db.session.query(Notification.id))
+
+
+def test_cap_breaks_timestamp_ties_by_id(notifications):
+    # Three rows share the boundary minute; newest first is ids[4], ids[3], ids[2], ids[1], ids[0]
+    ids = notifications(0, 5, 5, 5, 9)
+    assert cap_notifications_per_user(3, batch_size=1) == 2
+    assert kept_ids() == ids[2:]
+
+
+def test_user_at_the_cap_keeps_everything(notifications):
+    ids = notifications(0, 1, 1)
+    assert cap_notifications_per_user(3) == 0
+    assert kept_ids() == ids
+
+
+def test_cap_of_zero_deletes_everything(notifications):
+    notifications(0, 1)
+    assert cap_notifications_per_user(0) == 2
+    assert kept_ids() == []
+
+
+def test_vacuum_reports_sizes_not_a_negative_saving(app, notifications):
+    notifications(*range(50))
+    result = app.test_cli_runner().invoke(args=['prune-notifications', '--vacuum', 'incremental'])
+    assert result.exit_code == 0, result.output
+    assert 'KiB before' in result.output and '-' not in result.output.split('💾')[1]
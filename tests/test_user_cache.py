@@ -0,0 +1,37 @@
+# tests/test_user_cache.py - cached users skip the database, but a role change is seen within `recheck` seconds
+import time
+
+from app import db
+from app.models import User
+from app.user_cache import UserCache
+
+
+def test_hits_within_recheck_run_no_query(app, user, count_queries):
+    cache = UserCache(ttl=60, recheck=60)
+    with app.app_context():
+        cache.load(user, db.session)
+        db.session.remove()
+        assert count_queries(lambda: cache.load(user, db.session)) == 0
+        assert cache.stats()['hits'] == 1
+
+
+def test_role_change_elsewhere_is_seen_after_recheck(app, user, monkeypatch):
+    cache = UserCache(ttl=60, recheck=5)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+
+    with app.app_context():
+        role = cache.load(user, db.session).role
+        db.session.remove()
+        # Another process changes the role; no ORM commit here tells the cache
+        db.session.execute(db.update(User).where(User.id == user).values(role='admin'))
+        db.session.commit()
+        try:
+            assert cache.load(user, db.session).role == role  # still trusted
+            db.session.remove()
+
+            now += 6
+            assert cache.load(user, db.session).role == 'admin'
+        finally:
+            db.session.execute(db.update(User).where(User.id == user).values(role=role))
+            db.session.commit()